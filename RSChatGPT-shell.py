@@ -11,7 +11,9 @@ from langchain.agents.tools import Tool
 from langchain.chains.conversation.memory import ConversationBufferMemory
 import numpy as np
 from Prefix import  RS_CHATGPT_PREFIX, RS_CHATGPT_FORMAT_INSTRUCTIONS, RS_CHATGPT_SUFFIX
-from RStask import ImageEdgeFunction,CaptionFunction,LanduseFunction,DetectionFunction,CountingFuncnction,SceneFunction,InstanceFunction,ChangeDetectionFunction,CloudRemovalFunction,SuperResolutionFunction,DenoisingFunction,HorizontalDetectionFunction,RotatedDetectionFunction
+# 工具实现按需导入：只有 load_dict 中启用的工具才会加载对应模型代码及其依赖
+import RStask
+from RStask.Common.OutputWriter import wait_outputs
 
 # Promptomatix 集成
 try:
@@ -44,6 +46,37 @@ def clean_tool_input(inputs):
     
     return inputs
 
+def parse_tool_options(inputs):
+    """把 'a,b,key=value' 形式的工具输入拆分为位置参数列表与选项字典"""
+    parts, options = [], {}
+    for part in inputs.split(","):
+        part = part.strip()
+        if '=' in part:
+            key, value = part.split('=', 1)
+            options[key.strip().lower()] = value.strip()
+        elif part:
+            parts.append(part)
+    return parts, options
+
+QUALITY_HINT = ("Optionally append ',quality=fast', ',quality=balanced' (default) or ',quality=accurate' "
+                "to trade speed for accuracy. ")
+
+def quality_error(options):
+    """quality 选项取值无效时返回带用法提示的错误信息，否则返回 None"""
+    from RStask.Common.Quality import get_quality
+    try:
+        get_quality(options.get('quality'))
+    except ValueError as e:
+        return f"Error: {e}. " + QUALITY_HINT
+    return None
+
+def wait_before(func):
+    """工具结果在后台编码写出，下一个工具执行前等待全部写完（其输入可能是上一步的输出）"""
+    def run(inputs):
+        wait_outputs()
+        return func(inputs)
+    return run
+
 def prompts(name, description):
     def decorator(func):
         func.name = name
@@ -63,34 +96,49 @@ def get_new_image_name(org_img_name, func_name="update"):
 class EdgeDetection:
     def __init__(self, device):
         print("Initializing Edge Detection Function....")
-        self.func = ImageEdgeFunction()
+        self.func = RStask.ImageEdgeFunction()
     @prompts(name="Edge Detection On Image",
              description="useful when you want to detect the edge of the remote sensing image. "
                          "like: detect the edges of this image, or canny detection on image, "
                          "or perform edge detection on this image, or detect the  edge of this image. "
-                         "The input to this tool should be a string, representing the image_path")
+                         "The input to this tool should be a string, representing the image_path. "
+                         "Optionally append ',thresholds=median' or ',thresholds=otsu' for thresholds adapted to the image, "
+                         "',levels=N' for multi-scale edges, and ',output=bit' or ',output=rgb' for the edge map format.")
     def inference(self, inputs):
         inputs = clean_tool_input(inputs)
-        updated_image_path=get_new_image_name(inputs, func_name="edge")
-        self.func.inference(inputs,updated_image_path)
+        parts, options = parse_tool_options(inputs)
+        image_path = parts[0]
+        updated_image_path=get_new_image_name(image_path, func_name="edge")
+        levels = int(options['levels']) if 'levels' in options else None
+        try:
+            self.func.inference(image_path, updated_image_path, thresholds=options.get('thresholds'), levels=levels,
+                                output=options.get('output'))
+        except ValueError as e:
+            return f"Error: {e}"
         return updated_image_path
 
 class ChangeDetection:
     def __init__(self, device):
         print("Initializing Change Detection Function....")
-        self.func = ChangeDetectionFunction(device)
+        self.func = RStask.ChangeDetectionFunction(device)
     @prompts(name="Change Detection On Image Pair",
              description="useful when you want to detect changes between two remote sensing images taken at different times. "
                          "like: detect changes between these two images, or compare these images for changes, "
                          "or find what has changed between the before and after images, or identify the differences between two temporal images. "
                          "The input to this tool should be a comma separated string of two or three parts: "
                          "representing the pre_image_path (before), post_image_path (after), and optionally change_description. "
-                         "Example: 'image1.png,image2.png' or 'image1.png,image2.png,buildings have been constructed'")
+                         "Example: 'image1.png,image2.png' or 'image1.png,image2.png,buildings have been constructed'. "
+                         "It returns the changed area, the largest change regions with their bounding boxes and a GeoJSON of change polygons. "
+                         "By default a downsampled preview is saved; append ',output=mask' for the binary change mask only or "
+                         "',output=panel' for the full-resolution before/after/overlay panel, and ',format=jpg' or ',format=webp' "
+                         "for a compressed preview. If either image may contain clouds or haze, append ',cloud_mask=true' to ignore "
+                         "changes under clouds (no need to run cloud removal first). "
+                         "For large scenes append ',tiled=true' to detect changes at full resolution with overlapping tiles.")
     def inference(self, inputs):
         # Clean up the input
         inputs = clean_tool_input(inputs)
         
-        parts = inputs.split(",")
+        parts, options = parse_tool_options(inputs)
         if len(parts) < 2:
             return "Error: Need at least two images for change detection. Format: pre_image_path,post_image_path[,change_description]"
         
@@ -102,103 +150,167 @@ class ChangeDetection:
         updated_image_path = get_new_image_name(post_image_path, func_name="change_detection")
         
         # 执行变化检测
+        if options.get('tiled', '').lower() in ('1', 'true', 'yes'):
+            result_text = self.func.inference_tiled(
+                pre_image_path,
+                post_image_path,
+                updated_image_path,
+                change_caption=change_caption
+            )
+            return f"{result_text}. Output: {updated_image_path}"
+        product = options.get('output', 'preview').lower()
+        if product == 'preview' and options.get('format', '').lower() in ('jpg', 'jpeg', 'webp'):
+            updated_image_path = os.path.splitext(updated_image_path)[0] + '.' + options['format'].lower()
         result_text = self.func.inference(
             pre_image_path, 
             post_image_path, 
             updated_image_path,
-            change_caption=change_caption
+            change_caption=change_caption,
+            product=product,
+            cloud_mask=options.get('cloud_mask', '').lower() in ('1', 'true', 'yes')
         )
         
         return f"{result_text}. Output: {updated_image_path}"
 
+class TimeSeriesChangeDetection:
+    template_model = True
+    def __init__(self, ChangeDetection):
+        print("Initializing Time Series Change Detection, sharing the Change Detection model....")
+        self.func = ChangeDetection.func
+    @prompts(name="Time Series Change Detection",
+             description="useful when you want to analyse changes over three or more remote sensing images of the same area "
+                         "taken at different times, like: when did this area change, or how did the changed area grow over the years. "
+                         "The input to this tool should be a comma separated string of the image paths in time order, "
+                         "optionally followed by ',dates=2018|2019|2020' and ',caption=<change description>'. "
+                         "It returns the changed area of every interval, the cumulative changed area and a first-change-date map.")
+    def inference(self, inputs):
+        inputs = clean_tool_input(inputs)
+        image_paths, options = parse_tool_options(inputs)
+        if len(image_paths) < 2:
+            return "Error: Need at least two images in time order for time series change detection."
+        dates = options['dates'].split('|') if 'dates' in options else None
+        updated_image_path = get_new_image_name(image_paths[-1], func_name="first_change")
+        return self.func.inference_series(image_paths, updated_image_path,
+                                          change_caption=options.get('caption'), dates=dates)
+
 class ObjectCounting:
     def __init__(self, device):
-        self.func=CountingFuncnction(device)
+        self.func=RStask.CountingFuncnction(device)
     @prompts(name="Count object",
              description="useful when you want to count the number of the  object in the image. "
                          "like: how many planes are there in the image? or count the number of bridges"
                          "The input to this tool should be a comma separated string of two, "
-                         "representing the image_path, the text description of the object to be counted")
+                         "representing the image_path, the text description of the object to be counted. " + QUALITY_HINT)
     def inference(self, inputs):
         inputs = clean_tool_input(inputs)
-        image_path, det_prompt = inputs.split(",")
-        log_text=self.func.inference(image_path,det_prompt)
+        (image_path, det_prompt), options = parse_tool_options(inputs)
+        error = quality_error(options)
+        if error:
+            return error
+        log_text=self.func.inference(image_path,det_prompt,quality=options.get('quality'))
         return log_text
 
 
 class InstanceSegmentation:
     def __init__(self, device):
         print("Initializing InstanceSegmentation")
-        self.func=InstanceFunction(device)
+        self.func=RStask.InstanceFunction(device)
     @prompts(name="Instance Segmentation for Remote Sensing Image",
              description="useful when you want to apply man-made instance segmentation for the image. The expected input category include plane, ship, storage tank, baseball diamond, tennis court, basketball court, ground track field, harbor, bridge, vehicle, helicopter, roundabout, soccer ball field, and swimming pool."
                          "like: extract plane from this image, "
                          "or predict the ship in this image, or extract tennis court from this image, segment harbor from this image, Extract the vehicle in the image. "
                          "The input to this tool should be a comma separated string of two, "
-                         "representing the image_path, the text of the category,selected from plane, or ship, or storage tank, or baseball diamond, or tennis court, or basketball court, or ground track field, or harbor, or bridge, or vehicle, or helicopter, or roundabout, or soccer ball field, or  swimming pool. ")
+                         "representing the image_path, the text of the category,selected from plane, or ship, or storage tank, or baseball diamond, or tennis court, or basketball court, or ground track field, or harbor, or bridge, or vehicle, or helicopter, or roundabout, or soccer ball field, or  swimming pool. "
+                         "The output also reports the area percentage, instance count and bounding boxes of the category. " + QUALITY_HINT)
     def inference(self, inputs):
         inputs = clean_tool_input(inputs)
-        image_path, det_prompt = inputs.split(",")
+        (image_path, det_prompt), options = parse_tool_options(inputs)
+        error = quality_error(options)
+        if error:
+            return error
         updated_image_path = get_new_image_name(image_path, func_name="instance_" + det_prompt)
-        text=self.func.inference(image_path, det_prompt,updated_image_path)
+        text=self.func.inference(image_path, det_prompt,updated_image_path,quality=options.get('quality'))
         return text
 
 class SceneClassification:
     def __init__(self, device):
         print("Initializing SceneClassification")
-        self.func=SceneFunction(device)
+        self.func=RStask.SceneFunction(device)
     @prompts(name="Scene Classification for Remote Sensing Image",
              description="useful when you want to know the type of scene or function for the image. "
                          "like: what is the category of this image?, "
                          "or classify the scene of this image, or predict the scene category of this image, or what is the function of this image. "
-                         "The input to this tool should be a string, representing the image_path. ")
+                         "The input to this tool should be a string, representing the image_path. "
+                         "Several images can be classified at once with a comma separated list of image_paths. "
+                         "For a large scene, append ',map' to the image_path to get a coarse scene map classified tile by tile. " + QUALITY_HINT)
     def inference(self, inputs):
         inputs = clean_tool_input(inputs)
-        output_txt=self.func.inference(inputs)
+        parts, options = parse_tool_options(inputs)
+        error = quality_error(options)
+        if error:
+            return error
+        quality = options.get('quality')
+        if len(parts) == 2 and parts[1].lower() == 'map':
+            updated_image_path = get_new_image_name(parts[0], func_name="scene_map")
+            result = self.func.classify_tiles(parts[0], save_path=updated_image_path, quality=quality)
+            return f"Scene map of {parts[0]} saved to {updated_image_path}. Tile proportions: {result['summary']}."
+        if len(parts) > 1:
+            results = self.func.inference_batch(parts, topk=2, quality=quality)
+            return ' '.join(f"{r['image']}: " + ', '.join(f"{t['label']} {t['prob'] * 100:.2f}%" for t in r['topk']) + '.'
+                            for r in results)
+        output_txt=self.func.inference(parts[0], quality=quality)
         return output_txt
 
 
 class LandUseSegmentation:
     def __init__(self, device):
         print("Initializing LandUseSegmentation")
-        self.func=LanduseFunction(device)
+        self.func=RStask.LanduseFunction(device)
 
     @prompts(name="Land Use Segmentation for Remote Sensing Image",
              description="useful when you want to apply land use gegmentation for the image. The expected input category include Building, Road, Water, Barren, Forest, Farmland, Landuse."
                          "like: generate landuse map from this image, "
                          "or predict the landuse on this image, or extract building from this image, segment roads from this image, Extract the water bodies in the image. "
                          "The input to this tool should be a comma separated string of two, "
-                         "representing the image_path, the text of the category,selected from Lnad Use, or Building, or Road, or Water, or Barren, or Forest, or Farmland, or Landuse.")
+                         "representing the image_path, the text of the category,selected from Lnad Use, or Building, or Road, or Water, or Barren, or Forest, or Farmland, or Landuse. "
+                         "The output also reports the area percentage, region count and bounding boxes of each category, "
+                         "so questions like what percent of the image is farmland can be answered directly. " + QUALITY_HINT)
     def inference(self, inputs):
         inputs = clean_tool_input(inputs)
-        image_path, det_prompt = inputs.split(",")
+        (image_path, det_prompt), options = parse_tool_options(inputs)
+        error = quality_error(options)
+        if error:
+            return error
         updated_image_path = get_new_image_name(image_path, func_name="landuse")
-        text=self.func.inference(image_path, det_prompt,updated_image_path)
+        text=self.func.inference(image_path, det_prompt,updated_image_path,quality=options.get('quality'))
         return text
 
 class ObjectDetection:
     def __init__(self, device):
-        self.func=DetectionFunction(device)
+        self.func=RStask.DetectionFunction(device)
 
 
     @prompts(name="Detect the given object",
              description="useful when you only want to detect the bounding box of the certain objects in the picture according to the given text."
                          "like: detect the plane, or can you locate an object for me."
                          "The input to this tool should be a comma separated string of two, "
-                         "representing the image_path, the text description of the object to be found")
+                         "representing the image_path, the text description of the object to be found. " + QUALITY_HINT)
 
     def inference(self, inputs):
         inputs = clean_tool_input(inputs)
-        image_path, det_prompt = inputs.split(",")
+        (image_path, det_prompt), options = parse_tool_options(inputs)
+        error = quality_error(options)
+        if error:
+            return error
         updated_image_path = get_new_image_name(image_path, func_name="detection_" + det_prompt.replace(' ', '_'))
-        log_text=self.func.inference(image_path, det_prompt,updated_image_path)
+        log_text=self.func.inference(image_path, det_prompt,updated_image_path,quality=options.get('quality'))
         return log_text
 
 class ImageCaptioning:
     def __init__(self, device):
         print(f"Initializing ImageCaptioning to {device}")
         self.device = device
-        self.func=CaptionFunction(device)
+        self.func=RStask.CaptionFunction(device)
     @prompts(name="Get Photo Description",
              description="useful when you want to know what is inside the photo. receives image_path as input. "
                          "The input to this tool should be a string, representing the image_path. ")
@@ -211,7 +323,7 @@ class ImageCaptioning:
 class CloudRemoval:
     def __init__(self, device):
         print("Initializing Cloud Removal Function....")
-        self.func = CloudRemovalFunction()
+        self.func = RStask.CloudRemovalFunction()
     @prompts(name="Cloud Removal On Image",
              description="useful when you want to remove clouds or haze from remote sensing images. "
                          "like: remove clouds from this image, or dehaze this image, "
@@ -226,22 +338,27 @@ class CloudRemoval:
 class SuperResolution:
     def __init__(self, device):
         print("Initializing Super Resolution Function....")
-        self.func = SuperResolutionFunction()
+        self.func = RStask.SuperResolutionFunction(device)
     @prompts(name="Super Resolution On Image",
              description="useful when you want to enhance image resolution or upscale the image. "
                          "like: enhance the resolution of this image, or upscale this image, "
                          "or increase image quality, or make this image clearer with higher resolution. "
-                         "The input to this tool should be a string, representing the image_path")
+                         "The input to this tool should be a string, representing the image_path. "
+                         "Optionally append ',scale=N' (default 2) and ',backend=espcn' for the learned model "
+                         "instead of the fast bicubic default.")
     def inference(self, inputs):
         inputs = clean_tool_input(inputs)
-        updated_image_path = get_new_image_name(inputs, func_name="super_resolution")
-        self.func.inference(inputs, updated_image_path)
+        parts, options = parse_tool_options(inputs)
+        image_path = parts[0]
+        updated_image_path = get_new_image_name(image_path, func_name="super_resolution")
+        scale = float(options['scale']) if 'scale' in options else None
+        self.func.inference(image_path, updated_image_path, scale=scale, backend=options.get('backend'))
         return updated_image_path
 
 class Denoising:
     def __init__(self, device):
         print("Initializing Denoising Function....")
-        self.func = DenoisingFunction()
+        self.func = RStask.DenoisingFunction()
     @prompts(name="Denoising On Image",
              description="useful when you want to remove noise from the image or reduce image noise. "
                          "like: denoise this image, or remove noise from this image, "
@@ -256,7 +373,7 @@ class Denoising:
 class HorizontalDetection:
     def __init__(self, device):
         print("Initializing Horizontal Detection Function....")
-        self.func = HorizontalDetectionFunction()
+        self.func = RStask.HorizontalDetectionFunction()
     @prompts(name="Horizontal Detection On Image",
              description="useful when you want to detect objects with horizontal bounding boxes in the image. "
                          "like: detect objects with horizontal boxes, or find horizontal bounding boxes, "
@@ -271,7 +388,7 @@ class HorizontalDetection:
 class RotatedDetection:
     def __init__(self, device):
         print("Initializing Rotated Detection Function....")
-        self.func = RotatedDetectionFunction()
+        self.func = RStask.RotatedDetectionFunction()
     @prompts(name="Rotated Detection On Image",
              description="useful when you want to detect objects with rotated bounding boxes for arbitrary orientations. "
                          "like: detect rotated objects, or find objects at any angle, "
@@ -283,6 +400,40 @@ class RotatedDetection:
         self.func.inference(inputs, updated_image_path)
         return updated_image_path
 
+class ImagePipeline:
+    template_model = True
+    def __init__(self, CloudRemoval=None, Denoising=None, SuperResolution=None, EdgeDetection=None,
+                 ObjectDetection=None):
+        print("Initializing Image Pipeline, sharing the loaded image processing models....")
+        loaded = {'cloud_removal': CloudRemoval, 'denoise': Denoising, 'super_resolution': SuperResolution,
+                  'edge': EdgeDetection, 'detect': ObjectDetection}
+        self.func = RStask.PipelineFunction(tools={k: v.func for k, v in loaded.items() if v is not None})
+    @prompts(name="Image Processing Pipeline",
+             description="useful when you want to apply several image processing steps in a row to one image, "
+                         "like: remove clouds, denoise, then detect planes, or denoise and upscale this image. "
+                         "The input to this tool should be a comma separated string of two parts: the image_path and the "
+                         "steps joined by '|', chosen from cloud_removal, denoise, super_resolution[:scale], edge and "
+                         "detect:<object> (detect must be the last step). "
+                         "Example: 'image.png,cloud_removal|denoise|detect:plane'. Append ',save_intermediates=true' "
+                         "to also save the result of every step. " + QUALITY_HINT +
+                         "It returns the final image path and the time spent in each step.")
+    def inference(self, inputs):
+        inputs = clean_tool_input(inputs)
+        parts, options = parse_tool_options(inputs)
+        error = quality_error(options)
+        if error:
+            return error
+        if len(parts) < 2:
+            return "Error: Need an image path and a pipeline. Format: image_path,step1|step2|..."
+        image_path, spec = parts[0], parts[1]
+        updated_image_path = get_new_image_name(image_path, func_name="pipeline")
+        try:
+            return self.func.inference(image_path, spec, updated_image_path,
+                                       save_intermediates=options.get('save_intermediates', '').lower() in ('1', 'true', 'yes'),
+                                       quality=options.get('quality'))
+        except ValueError as e:
+            return f"Error: {e}"
+
 class RSChatGPT:
     def __init__(self, gpt_name, load_dict, openai_key, proxy_url, enable_query_optimization=False):
         print(f"Initializing RSChatGPT, load_dict={load_dict}")
@@ -295,12 +446,15 @@ class RSChatGPT:
         # Load Template Foundation Models
         for class_name, module in globals().items():
             if getattr(module, 'template_model', False):
-                template_required_names = {k for k in inspect.signature(module.__init__).parameters.keys() if
-                                           k != 'self'}
+                # 无默认值的参数必须已加载；有默认值的参数可选，已加载时一并传入（至少需要其中之一）
+                parameters = {k: v for k, v in inspect.signature(module.__init__).parameters.items() if k != 'self'}
+                template_required_names = {k for k, v in parameters.items() if v.default is inspect.Parameter.empty}
+                template_optional_names = set(parameters) - template_required_names
                 loaded_names = set([type(e).__name__ for e in self.models.values()])
-                if template_required_names.issubset(loaded_names):
+                if template_required_names.issubset(loaded_names) and (
+                        template_required_names or template_optional_names & loaded_names):
                     self.models[class_name] = globals()[class_name](
-                        **{name: self.models[name] for name in template_required_names})
+                        **{name: self.models[name] for name in (set(parameters) & loaded_names)})
 
         print(f"All the Available Functions: {self.models}")
 
@@ -309,7 +463,7 @@ class RSChatGPT:
             for e in dir(instance):
                 if e.startswith('inference'):
                     func = getattr(instance, e)
-                    self.tools.append(Tool(name=func.name, description=func.description, func=func))
+                    self.tools.append(Tool(name=func.name, description=func.description, func=wait_before(func)))
 
         self.llm = ChatOpenAI(api_key=openai_key, base_url=proxy_url, model_name=gpt_name,temperature=0)
         self.memory = ConversationBufferMemory(memory_key="chat_history", output_key='output')
@@ -349,6 +503,8 @@ class RSChatGPT:
             text = self.query_optimizer.optimize_if_ambiguous(text)
         
         res = self.agent({"input": text.strip()})
+        # 回复中引用的结果图像必须已写完
+        wait_outputs()
         res['output'] = res['output'].replace("\\", "/")
         response = re.sub('(image/[-\w]*.png)', lambda m: f'![](file={m.group(0)})*{m.group(0)}*', res['output'])
         state = state + [(original_text, response)]  # 使用原始查询显示给用户
@@ -406,7 +562,26 @@ if __name__ == '__main__':
                         default="ImageCaptioning_cuda:0,SceneClassification_cuda:0,ObjectDetection_cuda:0,ObjectCounting_cuda:0,EdgeDetection_cpu,ChangeDetection_cuda:0")
     parser.add_argument('--enable_query_optimization', action='store_true',
                         help='Enable Promptomatix query optimization')
+    parser.add_argument('--cpu_concurrency', type=int, default=None,
+                        help='Expected concurrent tool requests; OpenCV/PyTorch CPU threads are split between them '
+                             '(defaults to RSAGENT_CONCURRENCY or 1)')
+    parser.add_argument('--image_max_files', type=int, default=None,
+                        help='Keep at most this many result files under image/ (defaults to RSAGENT_IMAGE_MAX_FILES, unlimited)')
+    parser.add_argument('--image_max_age', type=int, default=None,
+                        help='Delete result files under image/ older than this many hours '
+                             '(defaults to RSAGENT_IMAGE_MAX_AGE, unlimited)')
     args = parser.parse_args()
+    from RStask.Common.CPUPolicy import apply_policy
+    print(apply_policy(args.cpu_concurrency))
+    if args.image_max_files is not None or args.image_max_age is not None:
+        from RStask.Common.OutputWriter import OutputWriter, set_writer
+        # 其余配置（如 RSAGENT_WRITER_THREADS）仍取自环境变量，只覆盖命令行给出的保留策略
+        writer = OutputWriter.from_env()
+        if args.image_max_files is not None:
+            writer.max_files = args.image_max_files
+        if args.image_max_age is not None:
+            writer.max_age = args.image_max_age * 3600 if args.image_max_age else None
+        set_writer(writer)
     state = []
     load_dict = {e.split('_')[0].strip(): e.split('_')[1].strip() for e in args.load.split(',')}
     bot = RSChatGPT(
@@ -1,19 +1,20 @@
-import sys
 import os
 import torch
 import torch.nn.functional as F
 import numpy as np
-from PIL import Image
-import clip
 import cv2
+import json
+import time
 
-# 添加 MMchange 路径
-MMCHANGE_PATH = '/root/MMchange-main'
-sys.path.insert(0, MMCHANGE_PATH)
-
-# 导入 MMchange 相关模块
-import Transforms as myTransforms
-from models.model import BaseNet, BaseNet_Hybrid
+# 使用包内的 MMchange 预处理与模型代码
+from RStask.ChangeDetection import Transforms as myTransforms
+from RStask.ChangeDetection.models.model import BaseNet, BaseNet_Hybrid
+from RStask.Common.FeatureCache import FeatureCache, feature_cache, array_hash
+from RStask.ChangeDetection.TextEncoder import CachedTextEncoder
+from RStask.Common.Tiling import tile_grid, batched
+from RStask.Common.OutputWriter import write_output, wait_outputs, temp_path
+from RStask.Common.Vectorize import extract_instances, polygonize, write_geojson
+from RStask.ChangeDetection.PairDataset import ChangePairDataset, collate_pairs, resolve_pairs, pair_name
 
 
 class MMChangeDetection:
@@ -58,10 +59,10 @@ class MMChangeDetection:
         self.model.eval()
         print("变化检测模型加载成功！")
         
-        # 加载 CLIP 模型用于文本编码
-        print("加载 CLIP 模型...")
-        self.clip_model, _ = clip.load("ViT-B/32", device=device)
-        print("CLIP 模型加载成功！")
+        # CLIP 文本编码器：只加载文本塔，描述嵌入缓存在磁盘上，
+        # 常用短语在启动时预编码，全部命中缓存时不会加载 CLIP
+        self.text_encoder = CachedTextEncoder("ViT-B/32", device=device)
+        print("CLIP 文本编码器就绪！")
         
         # 数据预处理配置（与训练时保持一致）
         mean = [0.406, 0.456, 0.485, 0.406, 0.456, 0.485]
@@ -71,46 +72,116 @@ class MMChangeDetection:
             myTransforms.Scale(self.img_size, self.img_size),
             myTransforms.ToTensor()
         ])
+        # 单时相预处理使用的 BGR 均值 / 方差
+        self.epoch_mean = np.array(mean[:3], dtype=np.float32)
+        self.epoch_std = np.array(std[:3], dtype=np.float32)
+        # 切片推理在设备端完成同样的归一化
+        self.mean = torch.tensor(mean, device=device).reshape((1, 1, 1, 6)) * 255
+        self.std = torch.tensor(std, device=device).reshape((1, 1, 1, 6)) * 255
+        self.tile_overlap = 64
+        self.cloud_detector = None
+        self.tile_batch_size = 16
         
         print("变化检测模块初始化完成！")
     
-    def preprocess_images(self, pre_image_path, post_image_path):
+    def read_pair(self, pre_image_path, post_image_path):
         """
-        预处理图像对
-        
+        读取图像对（使用 cv2，与训练时保持一致）
+
+        Returns:
+            pre_img, post_img: [H, W, 3] BGR uint8 数组
+        """
+        wait_outputs(pre_image_path)
+        wait_outputs(post_image_path)
+        return cv2.imread(pre_image_path), cv2.imread(post_image_path)
+
+    def preprocess_arrays(self, pre_img, post_img):
+        """
+        预处理已读取的图像对
+
         Args:
-            pre_image_path: 前时相图像路径
-            post_image_path: 后时相图像路径
-        
+            pre_img: 前时相图像 [H, W, 3]
+            post_img: 后时相图像 [H, W, 3]
+
         Returns:
             pre_img_tensor: 预处理后的前时相图像张量
             post_img_tensor: 预处理后的后时相图像张量
         """
-        # 读取图像（使用 cv2，与训练时保持一致）
-        import cv2
-        pre_img = cv2.imread(pre_image_path)
-        post_img = cv2.imread(post_image_path)
-        
         # 拼接前后时相图像（沿通道维度，与 dataset.py 中保持一致）
         # pre_img: [H, W, 3], post_img: [H, W, 3] -> img: [H, W, 6]
         img = np.concatenate((pre_img, post_img), axis=2)
-        
+
         # 创建虚拟的 label（二值标签）
         dummy_label = np.zeros((pre_img.shape[0], pre_img.shape[1]), dtype=np.float32)
-        
+
         # 应用变换 (transform 接受 img 和 label 两个参数)
         transformed = self.transform(img, dummy_label)
         img_tensor = transformed[0]  # [C*2, H, W]，其中 C=3
-        
+
         # 分离前后时相
         pre_img_tensor = img_tensor[0:3].unsqueeze(0)  # [1, 3, H, W]
         post_img_tensor = img_tensor[3:6].unsqueeze(0)  # [1, 3, H, W]
-        
+
         return pre_img_tensor, post_img_tensor
-    
+
+    def preprocess_images(self, pre_image_path, post_image_path):
+        """
+        预处理图像对
+
+        Args:
+            pre_image_path: 前时相图像路径
+            post_image_path: 后时相图像路径
+
+        Returns:
+            pre_img_tensor: 预处理后的前时相图像张量
+            post_img_tensor: 预处理后的后时相图像张量
+        """
+        return self.preprocess_arrays(*self.read_pair(pre_image_path, post_image_path))
+
+    def preprocess_epoch(self, img):
+        """
+        单独预处理一个时相，结果与 transform 对该时相所在 3 个通道的处理一致
+
+        注意 ToTensor 会整体翻转 6 个通道，因此 preprocess_arrays 返回的第一个张量实际来自后时相；
+        模型的第一个输入始终是后时相，第二个是前时相。
+
+        Args:
+            img: [H, W, 3] BGR uint8 数组
+
+        Returns:
+            img_tensor: [1, 3, S, S] RGB 张量
+        """
+        img = img.astype(np.float32) / 255
+        img = (img - self.epoch_mean) / self.epoch_std
+        img = cv2.resize(img, (self.img_size, self.img_size))
+        return torch.from_numpy(img[:, :, ::-1].transpose((2, 0, 1)).copy()).unsqueeze(0)
+
+    def encode_epochs(self, images, batch_size=8):
+        """
+        编码多个时相，特征按 (图像哈希, backbone, 输入尺寸) 缓存，
+        同一图像再次参与变化检测时只需运行变化检测头；未命中缓存的时相合并为 batch 编码
+
+        Args:
+            images: [H, W, 3] BGR uint8 数组列表
+            batch_size: 每次编码的最大时相数
+
+        Returns:
+            features: 与输入顺序一致的 Image_encoder.encode 特征金字塔列表
+        """
+        keys = [FeatureCache.make_key(array_hash(img), 'mmchange_resnet50', (self.img_size, self.img_size))
+                for img in images]
+        feats = [feature_cache.get(key) for key in keys]
+        missing = [i for i, f in enumerate(feats) if f is None]
+        for chunk in batched(missing, batch_size):
+            batch = torch.cat([self.preprocess_epoch(images[i]) for i in chunk], 0).to(self.device)
+            computed = self.model.Image_encoder.encode(batch)
+            for j, i in enumerate(chunk):
+                feats[i] = feature_cache.put(keys[i], tuple(f[j:j + 1] for f in computed))
+        return feats
+
     def encode_text(self, text):
         """
-        使用 CLIP 编码文本
+        使用 CLIP 编码文本（命中缓存时不运行文本塔）
         
         Args:
             text: 文本描述（字符串或字符串列表）
@@ -118,120 +189,552 @@ class MMChangeDetection:
         Returns:
             text_features: 文本特征张量
         """
-        if isinstance(text, str):
-            text = [text]
-        
-        text_tokens = clip.tokenize(text).to(self.device)
-        with torch.no_grad():
-            text_features = self.clip_model.encode_text(text_tokens)
-        
-        return text_features
+        return self.text_encoder.encode(text).to(self.device)
     
-    @torch.no_grad()
-    def inference(self, pre_image_path, post_image_path, output_path, 
-                  change_caption=None, caption_A=None, caption_B=None):
+    def text_features(self, change_caption=None, caption_A=None, caption_B=None):
         """
-        执行变化检测推理
-        
-        Args:
-            pre_image_path: 前时相图像路径
-            post_image_path: 后时相图像路径
-            output_path: 输出结果图像路径
-            change_caption: 变化描述文本（可选，默认为通用描述）
-            caption_A: 前时相图像描述（可选）
-            caption_B: 后时相图像描述（可选）
-        
+        准备模型所需的文本特征
+
         Returns:
-            result_text: 结果描述文本
+            change_text_features, text_A_features, text_B_features: 后两项在不需要时为 None
         """
-        # 预处理图像
-        pre_img, post_img = self.preprocess_images(pre_image_path, post_image_path)
-        
-        # 移动到设备
-        if 'cuda' in self.device:
-            pre_img = pre_img.cuda()
-            post_img = post_img.cuda()
-        
-        # 准备文本特征
         if change_caption is None:
             change_caption = "buildings have been constructed or demolished"
-        
+
         change_text_features = self.encode_text(change_caption)
         change_text_features = change_text_features.float()
-        
+
         if 'cuda' in self.device:
             change_text_features = change_text_features.cuda()
-        
+
         # 准备前后时相文本特征（如果使用混合架构）
         text_A_features = None
         text_B_features = None
-        
+
         if self.model_arch == 'basenet_hybrid' or (caption_A and caption_B):
             if caption_A is None:
                 caption_A = "An aerial image"
             if caption_B is None:
                 caption_B = "An aerial image"
-            
+
             text_A_features = self.encode_text(caption_A).float()
             text_B_features = self.encode_text(caption_B).float()
-            
+
             if 'cuda' in self.device:
                 text_A_features = text_A_features.cuda()
                 text_B_features = text_B_features.cuda()
-        
-        # 模型推理
+
+        return change_text_features, text_A_features, text_B_features
+
+    def run_head(self, pre_feats, post_feats, texts):
+        """
+        在时相特征上运行变化检测头（推理模式，只计算最终变化图）
+
+        文本特征的 batch 维为 1 时在 ITFF 中自动广播到所有图像对，同一描述只需编码一次。
+
+        Returns:
+            logits: [N, 1, H/4, W/4] 低分辨率变化 logits
+        """
+        change_text_features, text_A_features, text_B_features = texts
         if self.model_arch == 'basenet_hybrid':
-            output, _, _, _ = self.model(
-                pre_img, post_img, change_text_features, text_A_features, text_B_features
+            return self.model.forward_features(
+                pre_feats, post_feats, change_text_features, text_A_features, text_B_features,
+                inference=True, logits=True
             )
-        else:
-            if self.use_change_caption:
-                output, _, _, _ = self.model(pre_img, post_img, change_text_features)
-            else:
-                output, _, _, _ = self.model(pre_img, post_img, text_A_features, text_B_features)
+        if self.use_change_caption:
+            return self.model.forward_features(pre_feats, post_feats, change_text_features,
+                                               inference=True, logits=True)
+        return self.model.forward_features(pre_feats, post_feats, text_A_features, text_B_features,
+                                           inference=True, logits=True)
+
+    @torch.no_grad()
+    def predict_batch(self, pre_batch, post_batch, change_caption=None, caption_A=None, caption_B=None,
+                      logits=False, texts=None):
+        """
+        批量推理多对图像：前后时相拼接为一个 batch 经过孪生编码器，文本描述只编码一次
+
+        Args:
+            pre_batch, post_batch: 预处理后的前后时相张量 [N, 3, H, W]
+            change_caption, caption_A, caption_B: 同 inference
+            logits: 为 True 时返回 1/4 分辨率 logits，不做上采样与 sigmoid
+            texts: 可选，预先准备好的 text_features 输出，给出时忽略各描述参数
+
+        Returns:
+            output: [N, 1, H, W] 变化概率（logits=True 时为 [N, 1, H/4, W/4] logits）
+        """
+        if texts is None:
+            texts = self.text_features(change_caption, caption_A, caption_B)
+        feats = self.model.Image_encoder(pre_batch.to(self.device), post_batch.to(self.device))
+        output = self.run_head(feats[:4], feats[4:], texts)
+        if logits:
+            return output
+        return torch.sigmoid(F.interpolate(output, scale_factor=(4, 4), mode='bilinear'))
+
+    @torch.no_grad()
+    def inference(self, pre_image_path, post_image_path, output_path, 
+                  change_caption=None, caption_A=None, caption_B=None, product='preview', max_side=1024,
+                  cloud_mask=False, cloud_threshold=0.6):
+        """
+        执行变化检测推理
         
-        # 二值化预测结果
-        pred = torch.where(output > 0.5, torch.ones_like(output), torch.zeros_like(output))
-        pred = pred.cpu().numpy()[0, 0]  # [H, W]
+        Args:
+            pre_image_path: 前时相图像路径
+            post_image_path: 后时相图像路径
+            output_path: 输出结果图像路径
+            change_caption: 变化描述文本（可选，默认为通用描述）
+            caption_A: 前时相图像描述（可选）
+            caption_B: 后时相图像描述（可选）
+            product: 输出产品，'mask' / 'preview'（默认）/ 'panel'，见 save_product
+            max_side: 预览图最长边
+            cloud_mask: 为 True 时在内存中估计两个时相的云 / 厚雾掩膜，并抑制掩膜内的变化
+            cloud_threshold: 云掩膜的暗通道阈值
         
-        # 读取原始图像用于可视化
-        pre_img_raw = cv2.imread(pre_image_path)
-        post_img_raw = cv2.imread(post_image_path)
+        Returns:
+            result_text: 结果描述文本
+        """
+        # 读取图像
+        pre_img_raw, post_img_raw = self.read_pair(pre_image_path, post_image_path)
+
+        # 编码前后时相（命中缓存时跳过 backbone，均未命中时合并为一次前向）
+        pre_feats, post_feats = self.encode_epochs([pre_img_raw, post_img_raw])
+
+        # 模型推理，得到 1/4 分辨率 logits（与训练一致，第一个输入为后时相）
+        output = self.run_head(post_feats, pre_feats, self.text_features(change_caption, caption_A, caption_B))
+
+        # 上采样后直接对 logits 阈值化（logits > 0 等价于 sigmoid > 0.5）
+        output = F.interpolate(output, scale_factor=(4, 4), mode='bilinear')
+        pred = (output > 0).cpu().numpy()[0, 0]  # [S, S] 布尔掩膜
+        prob = torch.sigmoid(output).cpu().numpy()[0, 0]
         
         # 调整预测结果尺寸以匹配原始图像
         h, w = pre_img_raw.shape[:2]
-        pred_resized = cv2.resize(pred, (w, h), interpolation=cv2.INTER_NEAREST)
-        
-        # 创建可视化结果
-        # 将预测结果转换为彩色图像（红色表示变化区域）
-        pred_vis = np.zeros((h, w, 3), dtype=np.uint8)
-        pred_vis[pred_resized > 0.5] = [0, 0, 255]  # 变化区域用红色标记
-        
-        # 将变化区域叠加到后时相图像上
-        alpha = 0.5
-        result_vis = post_img_raw.copy().astype(np.float32)
-        mask = pred_resized > 0.5
-        # 使用 numpy 数组操作实现混合效果
-        result_vis[mask] = (1 - alpha) * post_img_raw[mask] + alpha * pred_vis[mask]
-        result_vis = result_vis.astype(np.uint8)
-        
-        # 拼接前时相、后时相和变化检测结果
-        vis = np.hstack([
-            cv2.resize(pre_img_raw, (w, h)),
-            cv2.resize(post_img_raw, (w, h)),
-            result_vis
-        ])
+        mask = cv2.resize(pred.astype(np.uint8), (w, h), interpolation=cv2.INTER_NEAREST) > 0
+        
+        # 云掩膜：任一时相有云的区域不判为变化
+        cloud_text = ''
+        if cloud_mask:
+            pre_cloud, post_cloud = self.cloud_masks(pre_img_raw, post_img_raw, cloud_threshold)
+            cloud = pre_cloud | post_cloud
+            mask &= ~cloud
+            pred = pred & ~(cv2.resize(cloud.astype(np.uint8), pred.shape[::-1], interpolation=cv2.INTER_NEAREST) > 0)
+            cloud_text = (f". Cloud/haze masked area: {cloud.mean() * 100:.2f}% (pre {pre_cloud.mean() * 100:.2f}%, "
+                          f"post {post_cloud.mean() * 100:.2f}%), change inside it was suppressed")
         
-        # 保存结果
-        cv2.imwrite(output_path, vis)
+        # 保存所需的输出产品（三联图只在需要时生成）
+        output_path = self.save_product(output_path, product, pre_img_raw, post_img_raw, pred, mask, max_side)
         
         # 计算变化像素数量和比例
         total_pixels = h * w
-        changed_pixels = np.sum(pred_resized > 0.5)
+        changed_pixels = int(mask.sum())
         change_ratio = changed_pixels / total_pixels * 100
         
         result_text = f"Change detection completed. Changed area: {change_ratio:.2f}% ({changed_pixels}/{total_pixels} pixels). Result saved to {output_path}"
+        result_text += cloud_text
         
+        # 在缩放前的二值掩膜上提取变化区域并导出多边形
+        region_text, _ = self.change_regions(pred, (h, w), os.path.splitext(output_path)[0] + '.geojson',
+                                             prob=prob)
+        result_text += '. ' + region_text
+        
+        print(result_text)
+        return result_text
+
+    def change_regions(self, mask, size, geojson_path=None, prob=None, min_area=4, top_k=5):
+        """
+        在模型分辨率的二值变化掩膜上做连通域分析，坐标与面积换算到原图尺寸
+
+        Args:
+            mask: [S, S] 二值变化掩膜（缩放前）
+            size: 原图尺寸 (H, W)
+            geojson_path: 可选，导出变化区域多边形（原图像素坐标）
+            prob: 可选，[S, S] 变化概率，用于给出每个区域的平均置信度
+            min_area: 最小区域面积（模型分辨率像素）
+            top_k: 摘要中列出的最大区域数
+
+        Returns:
+            summary: 文本摘要
+            regions: 按面积降序的区域列表，每项包含 area / bbox(x, y, w, h) / centroid(x, y) / score
+        """
+        h, w = size
+        sy, sx = h / mask.shape[0], w / mask.shape[1]
+        _, instances = extract_instances(mask, min_area=min_area, prob=prob)
+        regions = []
+        for inst in sorted(instances, key=lambda k: k['area'], reverse=True):
+            x, y, bw, bh = inst['bbox']
+            region = {'area': int(round(inst['area'] * sx * sy)),
+                      'bbox': [int(round(x * sx)), int(round(y * sy)), int(round(bw * sx)), int(round(bh * sy))],
+                      'centroid': [round(inst['centroid'][0] * sx, 1), round(inst['centroid'][1] * sy, 1)]}
+            if 'score' in inst:
+                region['score'] = round(inst['score'], 3)
+            regions.append(region)
+
+        summary = f"{len(regions)} change regions"
+        if regions:
+            summary += ', largest: ' + '; '.join(
+                f"area {r['area']} px bbox(x,y,w,h) {r['bbox']} centroid {r['centroid']}" for r in regions[:top_k])
+        if geojson_path is not None:
+            # 仿射参数把模型分辨率像素坐标缩放到原图像素坐标
+            features = [(rings, {'change': True}) for rings in polygonize(mask, min_area=min_area)]
+            write_geojson(features, geojson_path, geotransform=(0, sx, 0, 0, 0, sy))
+            summary += f'. Change polygons exported to {geojson_path}'
+        return summary, regions
+
+    def cloud_masks(self, pre_img_raw, post_img_raw, threshold=0.6):
+        """用暗通道在内存中估计前后时相的云 / 厚雾掩膜，无需先生成去云图像再读回"""
+        if self.cloud_detector is None:
+            from RStask.CloudRemoval.DarkChannel import DarkChannelCloudRemoval
+            self.cloud_detector = DarkChannelCloudRemoval()
+        return (self.cloud_detector.get_cloud_mask(pre_img_raw, threshold),
+                self.cloud_detector.get_cloud_mask(post_img_raw, threshold))
+
+    @torch.no_grad()
+    def inference_series(self, image_paths, output_path, change_caption=None, dates=None, batch_size=8):
+        """
+        多时相时间序列变化分析
+
+        每个时相只经过一次 Image_encoder（特征进入共享缓存），相邻时相对只运行
+        IFR / TDE / ITFF / Decoder，多个时相对合并为一个 batch。面积占比在模型输入分辨率上统计。
+
+        Args:
+            image_paths: 按时间先后排列的同一区域图像路径（至少两幅，尺寸一致）
+            output_path: 首次变化时间图 PNG 输出路径，区间统计同时保存为同名 .json
+            change_caption: 变化描述文本，所有时相对共用
+            dates: 可选，各时相的日期标签，默认为 t0, t1, ...
+            batch_size: 每次编码 / 推理的最大时相（对）数
+
+        Returns:
+            result_text: 各区间变化面积与累计变化面积的描述文本
+        """
+        if len(image_paths) < 2:
+            raise ValueError("Time-series change detection needs at least two images")
+        dates = list(dates) if dates else [f"t{i}" for i in range(len(image_paths))]
+        if len(dates) != len(image_paths):
+            raise ValueError(f"Got {len(dates)} dates for {len(image_paths)} images")
+        images = [cv2.imread(path) for path in image_paths]
+        for path, img in zip(image_paths, images):
+            if img is None:
+                raise ValueError(f"Failed to read image {path}")
+            if img.shape != images[0].shape:
+                raise ValueError(f"All epochs must have the same size, {path} is {img.shape[:2]}")
+        h, w = images[0].shape[:2]
+
+        feats = self.encode_epochs(images, batch_size)
+        texts = self.text_features(change_caption)
+        masks = []
+        for chunk in batched(list(range(1, len(images))), batch_size):
+            # 第一个输入为后时相、第二个为前时相
+            post = tuple(torch.cat([feats[t][k] for t in chunk]) for k in range(4))
+            pre = tuple(torch.cat([feats[t - 1][k] for t in chunk]) for k in range(4))
+            output = F.interpolate(self.run_head(post, pre, texts), scale_factor=(4, 4), mode='bilinear')
+            masks.append((output[:, 0] > 0).cpu().numpy())
+        masks = np.concatenate(masks)  # [N-1, S, S]
+
+        # 首次变化时间：0 表示始终未变化，t 表示在 dates[t-1] -> dates[t] 区间首次变化
+        first = np.where(masks.any(0), masks.argmax(0) + 1, 0).astype(np.uint16)
+        interval = masks.reshape(len(masks), -1).mean(1)
+        cumulative = np.logical_or.accumulate(masks, axis=0).reshape(len(masks), -1).mean(1)
+
+        palette = np.random.RandomState(0).randint(64, 255, (len(images), 3)).astype(np.uint8)
+        palette[0] = 0
+        first_full = cv2.resize(first, (w, h), interpolation=cv2.INTER_NEAREST)
+        write_output(palette[first_full], output_path, bgr=True)
+
+        curve = [{'from': dates[t - 1], 'to': dates[t], 'changed': float(interval[t - 1]),
+                  'cumulative': float(cumulative[t - 1]), 'color_bgr': palette[t].tolist()}
+                 for t in range(1, len(images))]
+        json_path = os.path.splitext(output_path)[0] + '.json'
+        with open(json_path, 'w') as f:
+            json.dump({'dates': dates, 'images': list(image_paths), 'intervals': curve}, f)
+
+        intervals = ', '.join(f"{c['from']}->{c['to']}: {c['changed'] * 100:.2f}%" for c in curve)
+        result_text = (f"Time-series change detection over {len(images)} epochs completed. "
+                       f"Changed area per interval: {intervals}; cumulative changed area: "
+                       f"{cumulative[-1] * 100:.2f}%. First-change-date map saved to {output_path}, "
+                       f"interval statistics saved to {json_path}")
         print(result_text)
         return result_text
 
+    @torch.no_grad()
+    def render_overlay(self, img, mask, alpha=0.5):
+        """
+        在设备上把变化区域以红色半透明叠加到图像上
+
+        Args:
+            img: [H, W, 3] BGR uint8 数组或设备上的张量
+            mask: [H, W] 布尔变化掩膜（数组或张量）
+            alpha: 红色的混合比例
+
+        Returns:
+            overlay: 设备上的 [H, W, 3] uint8 张量
+        """
+        img = torch.as_tensor(img).to(self.device)
+        mask = torch.as_tensor(mask).to(self.device).unsqueeze(-1)
+        red = torch.tensor([0, 0, 255], dtype=torch.float32, device=self.device)
+        blended = (img.float() * (1 - alpha) + red * alpha).to(torch.uint8)
+        return torch.where(mask, blended, img)
+
+    @torch.no_grad()
+    def render_panel(self, pre_img_raw, post_img_raw, mask):
+        """
+        在设备上生成 [前时相 | 后时相 | 变化叠加] 三联可视化图
+
+        Args:
+            pre_img_raw, post_img_raw: [H, W, 3] BGR 图像
+            mask: [H, W] 布尔变化掩膜
+
+        Returns:
+            vis: [H, 3W, 3] uint8 图像
+        """
+        post = torch.as_tensor(post_img_raw).to(self.device)
+        vis = torch.cat([torch.as_tensor(pre_img_raw).to(self.device), post, self.render_overlay(post, mask)], 1)
+        return vis.cpu().numpy()
+
+    def render_preview(self, post_img_raw, pred, max_side=1024):
+        """
+        生成降采样预览图：后时相缩小到最长边不超过 max_side，再叠加同尺寸的变化掩膜
+
+        Args:
+            post_img_raw: [H, W, 3] BGR 图像
+            pred: 模型分辨率的二值变化掩膜
+            max_side: 预览图最长边
+
+        Returns:
+            preview: [h, w, 3] uint8 图像
+        """
+        h, w = post_img_raw.shape[:2]
+        scale = min(1.0, max_side / max(h, w))
+        size = (max(int(round(w * scale)), 1), max(int(round(h * scale)), 1))
+        img = post_img_raw if scale == 1.0 else cv2.resize(post_img_raw, size, interpolation=cv2.INTER_AREA)
+        mask = cv2.resize(pred.astype(np.uint8), size, interpolation=cv2.INTER_NEAREST) > 0
+        return self.render_overlay(img, mask).cpu().numpy()
+
+    def save_product(self, output_path, product, pre_img_raw, post_img_raw, pred, mask, max_side=1024):
+        """
+        按需保存输出产品（交给共享的输出写出服务在后台编码）
+
+        Args:
+            output_path: 输出路径，预览图的格式（png / jpg / webp）由扩展名决定
+            product: 'mask' 二值掩膜 PNG，'preview' 降采样叠加预览，'panel' 全分辨率三联图
+            pred: 模型分辨率的二值变化掩膜
+            mask: 原图分辨率的布尔变化掩膜
+
+        Returns:
+            output_path: 实际保存的路径
+        """
+        if product == 'mask':
+            output_path, _ = write_output(mask.astype(np.uint8) * 255, output_path, product='label', fmt='png')
+        elif product == 'preview':
+            output_path, _ = write_output(self.render_preview(post_img_raw, pred, max_side), output_path,
+                                          product='preview', bgr=True)
+        elif product == 'panel':
+            output_path, _ = write_output(self.render_panel(pre_img_raw, post_img_raw, mask), output_path, bgr=True)
+        else:
+            raise ValueError(f"Unknown output product: {product}, expected one of ['mask', 'preview', 'panel']")
+        return output_path
+
+    def preprocess_tiles(self, pre_tiles, post_tiles):
+        """
+        在设备端批量预处理切片，与 transform（Normalize + ToTensor）的结果一致
+
+        Args:
+            pre_tiles, post_tiles: [N, h, w, 3] BGR uint8 数组
+
+        Returns:
+            pre_tensor, post_tensor: [N, 3, h, w] 张量
+        """
+        img = torch.as_tensor(np.concatenate((pre_tiles, post_tiles), axis=3)).to(self.device, non_blocking=True)
+        img = (img.float() - self.mean) / self.std
+        # 与 ToTensor 相同，整体翻转 6 个通道后再按前 3 / 后 3 通道拆分
+        img = img.flip(-1).permute(0, 3, 1, 2).contiguous()
+        return img[:, 0:3], img[:, 3:6]
+
+    @staticmethod
+    def blend_window(tile_size, overlap):
+        """切片融合权重：距窗口边缘 overlap 像素内线性衰减，保证处处为正"""
+        ramp = np.minimum(np.arange(1, tile_size + 1), np.arange(tile_size, 0, -1)).astype(np.float32)
+        ramp = np.clip(ramp / (max(overlap, 0) + 1), 0, 1)
+        return np.outer(ramp, ramp)
+
+    @torch.no_grad()
+    def inference_tiled(self, pre_image_path, post_image_path, output_path, change_caption=None,
+                        caption_A=None, caption_B=None, tile_size=None, overlap=None, batch_size=None,
+                        raw_path=None):
+        """
+        全分辨率切片变化检测，适用于大幅影像
+
+        两个时相按相同位置切出带重叠的窗口，批量推理后按融合权重拼接概率。
+        按窗口行推进，已完成的行立即阈值化并写入磁盘上的掩膜，内存只与一行窗口和 batch 大小有关。
+
+        Args:
+            pre_image_path, post_image_path: 前后时相图像路径（尺寸须一致）
+            output_path: 变化掩膜 PNG 输出路径（255 为变化）
+            change_caption, caption_A, caption_B: 同 inference
+            tile_size: 窗口边长，默认为模型输入尺寸
+            overlap: 相邻窗口重叠像素数
+            batch_size: 每个 batch 的窗口数
+            raw_path: 可选，保留逐行写入的 .npy 掩膜；为空时使用临时文件
+
+        Returns:
+            result_text: 结果描述文本
+        """
+        tile_size = tile_size or self.img_size
+        overlap = self.tile_overlap if overlap is None else overlap
+        batch_size = batch_size or self.tile_batch_size
+        pre_img_raw, post_img_raw = self.read_pair(pre_image_path, post_image_path)
+        if pre_img_raw.shape != post_img_raw.shape:
+            raise ValueError(f"Image pair must have the same size for tiled change detection, "
+                             f"got {pre_img_raw.shape} and {post_img_raw.shape}")
+        h, w = pre_img_raw.shape[:2]
+        texts = self.text_features(change_caption, caption_A, caption_B)
+        weight = self.blend_window(tile_size, overlap)
+        ys, xs = tile_grid(h, w, tile_size, overlap)
+
+        remove_raw = raw_path is None
+        if remove_raw:
+            raw_path = temp_path(os.path.dirname(os.path.abspath(output_path)), '.npy')
+        mask = np.lib.format.open_memmap(raw_path, mode='w+', dtype=np.uint8, shape=(h, w))
+
+        # 行缓冲：acc[0] 对应图像第 top 行
+        acc = np.zeros((tile_size, w), dtype=np.float32)
+        acc_w = np.zeros((tile_size, w), dtype=np.float32)
+        top, changed = 0, 0
+
+        def flush(rows):
+            nonlocal changed
+            rows = min(rows, h - top)
+            band = acc[:rows] > 0.5 * acc_w[:rows]
+            mask[top:top + rows] = band.astype(np.uint8) * 255
+            changed += int(band.sum())
+            return rows
+
+        for y in ys:
+            # 起点之前的行不会再被后续窗口覆盖，写盘后移出缓冲
+            if y > top:
+                rows = flush(y - top)
+                acc[:-rows], acc_w[:-rows] = acc[rows:].copy(), acc_w[rows:].copy()
+                acc[-rows:], acc_w[-rows:] = 0, 0
+                top += rows
+            th = min(tile_size, h - y)
+            for chunk in batched(xs, batch_size):
+                pre_tiles, post_tiles = [], []
+                for x in chunk:
+                    tw = min(tile_size, w - x)
+                    for tiles, img in ((pre_tiles, pre_img_raw), (post_tiles, post_img_raw)):
+                        tile = img[y:y + th, x:x + tw]
+                        if (th, tw) != (tile_size, tile_size):
+                            tile = cv2.copyMakeBorder(tile, 0, tile_size - th, 0, tile_size - tw,
+                                                      cv2.BORDER_REFLECT_101)
+                        tiles.append(tile)
+                pre_batch, post_batch = self.preprocess_tiles(np.stack(pre_tiles), np.stack(post_tiles))
+                probs = self.predict_batch(pre_batch, post_batch, texts=texts).cpu().numpy()[:, 0]
+                for x, prob in zip(chunk, probs):
+                    tw = min(tile_size, w - x)
+                    acc[:th, x:x + tw] += prob[:th, :tw] * weight[:th, :tw]
+                    acc_w[:th, x:x + tw] += weight[:th, :tw]
+        flush(h - top)
+        mask.flush()
+
+        # 后台编码，写完后删除临时的逐行掩膜
+        write_output(mask, output_path, product='label', remove=[raw_path] if remove_raw else ())
+
+        total_pixels = h * w
+        change_ratio = changed / total_pixels * 100
+        result_text = (f"Tiled change detection completed on {len(ys) * len(xs)} tiles. "
+                       f"Changed area: {change_ratio:.2f}% ({changed}/{total_pixels} pixels). "
+                       f"Change mask saved to {output_path}")
+        print(result_text)
+        return result_text
+
+    def write_prediction(self, output_path, pred, size, raw=None):
+        """
+        把 256 分辨率的预测还原到原始尺寸并提交写出；给出原图时保存三联可视化图，否则保存 0/255 掩膜
+
+        Returns:
+            future: 写出任务的 Future，写完后返回路径
+            changed: 变化像素数
+            total: 总像素数
+        """
+        h, w = size
+        mask = cv2.resize(pred, (w, h), interpolation=cv2.INTER_NEAREST) > 0
+        if raw is not None:
+            _, future = write_output(self.render_panel(raw[0], raw[1], mask), output_path, bgr=True)
+        else:
+            _, future = write_output(mask.astype(np.uint8) * 255, output_path, product='label')
+        return future, int(mask.sum()), h * w
+
+    @torch.no_grad()
+    def inference_batch(self, source, output_dir, change_caption=None, caption_A=None, caption_B=None,
+                        batch_size=16, num_workers=4, save_panel=False, resume=True):
+        """
+        批量变化检测
+
+        多进程 DataLoader 预取并预处理图像对（锁页内存），批量推理，结果交给输出写出服务在后台编码。
+        每对结果写完后才追加到 output_dir/progress.jsonl，中断后再次运行会跳过已完成的图像对。
+
+        Args:
+            source: (pre_dir, post_dir) 目录对（按文件名配对）、清单文件路径或图像路径对列表
+            output_dir: 输出目录，结果以前时相文件名保存为 PNG
+            change_caption, caption_A, caption_B: 同 inference，所有图像对共用
+            batch_size: 每个 batch 的图像对数
+            num_workers: 读取与预处理的 worker 进程数
+            save_panel: 为 True 时保存三联可视化图，否则只保存变化掩膜
+            resume: 是否跳过 progress.jsonl 中已完成的图像对
+
+        Returns:
+            summary: {'processed', 'skipped', 'failed', 'seconds', 'pairs_per_sec', 'progress_path'}
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        progress_path = os.path.join(output_dir, 'progress.jsonl')
+        pairs = resolve_pairs(source)
+        done = set()
+        if resume and os.path.exists(progress_path):
+            with open(progress_path) as f:
+                done = set(json.loads(line)['name'] for line in f if line.strip())
+        todo = [p for p in pairs if pair_name(p[0]) not in done]
+        skipped = len(pairs) - len(todo)
+
+        texts = self.text_features(change_caption, caption_A, caption_B)
+        loader = torch.utils.data.DataLoader(
+            ChangePairDataset(todo, self.transform, keep_raw=save_panel), batch_size=batch_size,
+            num_workers=num_workers, collate_fn=collate_pairs, pin_memory='cuda' in self.device)
+
+        failed, pending = [], []
+
+        def drain(block):
+            # 按提交顺序取出已写完的结果，写出完成后才记录进度；写出失败的图像对计入 failed，下次运行会重新处理
+            while pending and (block or pending[0][1].done()):
+                i, future, changed, total = pending.pop(0)
+                try:
+                    future.result()
+                except Exception as e:
+                    failed.append((todo[i], e))
+                    continue
+                with open(progress_path, 'a') as f:
+                    f.write(json.dumps({'name': pair_name(todo[i][0]), 'pre': todo[i][0], 'post': todo[i][1],
+                                        'changed': changed, 'total': total}) + '\n')
+
+        start = time.time()
+        for batch in loader:
+            for item in batch['failed']:
+                failed.append((todo[item['index']], item['error']))
+            if not batch['index']:
+                continue
+            output = self.predict_batch(batch['pre'].to(self.device, non_blocking=True),
+                                        batch['post'].to(self.device, non_blocking=True),
+                                        logits=True, texts=texts)
+            preds = (F.interpolate(output, scale_factor=(4, 4), mode='bilinear') > 0)
+            preds = preds.to(torch.uint8).cpu().numpy()[:, 0]
+            for i, pred, size, raw in zip(batch['index'], preds, batch['size'], batch['raw']):
+                path = os.path.join(output_dir, pair_name(todo[i][0]) + '.png')
+                pending.append((i, *self.write_prediction(path, pred, size, raw)))
+            drain(block=False)
+        drain(block=True)
+        seconds = time.time() - start
+
+        processed = len(todo) - len(failed)
+        summary = {'processed': processed, 'skipped': skipped, 'failed': failed, 'seconds': seconds,
+                   'pairs_per_sec': processed / seconds if seconds > 0 else 0.0, 'progress_path': progress_path}
+        print(f"Batch change detection: {processed} pairs in {seconds:.1f}s "
+              f"({summary['pairs_per_sec']:.2f} pairs/sec), {skipped} skipped, {len(failed)} failed. "
+              f"Results in {output_dir}")
+        return summary
@@ -0,0 +1,88 @@
+import os
+import cv2
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp')
+
+
+def list_pairs(pre_dir, post_dir):
+    """按文件名匹配两个目录中的前后时相图像（如 LEVIR 的 A / B 目录）"""
+    post_files = set(os.listdir(post_dir))
+    pairs = []
+    for name in sorted(os.listdir(pre_dir)):
+        if name.lower().endswith(IMAGE_EXTENSIONS) and name in post_files:
+            pairs.append((os.path.join(pre_dir, name), os.path.join(post_dir, name)))
+    return pairs
+
+
+def read_manifest(path):
+    """读取清单文件，每行 'pre_path,post_path'，空行与 # 开头的行被忽略；相对路径相对于清单所在目录"""
+    root = os.path.dirname(os.path.abspath(path))
+    pairs = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = [p.strip() for p in line.split(',')]
+            if len(parts) < 2:
+                raise ValueError(f"Invalid manifest line in {path}: {line}")
+            pairs.append(tuple(os.path.join(root, p) for p in parts[:2]))
+    return pairs
+
+
+def resolve_pairs(source):
+    """
+    把批处理输入统一为 (pre_path, post_path) 列表
+
+    Args:
+        source: (pre_dir, post_dir) 目录对、清单文件路径或图像路径对列表
+    """
+    if isinstance(source, str):
+        return read_manifest(source)
+    if isinstance(source, tuple) and len(source) == 2 and all(os.path.isdir(p) for p in source):
+        return list_pairs(*source)
+    return [tuple(p) for p in source]
+
+
+def pair_name(pre_path):
+    return os.path.splitext(os.path.basename(pre_path))[0]
+
+
+class ChangePairDataset(Dataset):
+    """在 DataLoader worker 中读取并预处理图像对，每幅图像只读取一次"""
+    def __init__(self, pairs, transform, keep_raw=False):
+        self.pairs = pairs
+        self.transform = transform
+        self.keep_raw = keep_raw
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __getitem__(self, index):
+        pre_path, post_path = self.pairs[index]
+        pre_img, post_img = cv2.imread(pre_path), cv2.imread(post_path)
+        if pre_img is None or post_img is None:
+            return {'index': index, 'error': f"failed to read {pre_path if pre_img is None else post_path}"}
+        if pre_img.shape != post_img.shape:
+            return {'index': index, 'error': f"size mismatch {pre_img.shape} vs {post_img.shape}"}
+        # 与 MMChangeDetection.preprocess_arrays 相同：沿通道拼接后整体变换
+        img = np.concatenate((pre_img, post_img), axis=2)
+        img_tensor = self.transform(img, np.zeros(pre_img.shape[:2], dtype=np.float32))[0]
+        item = {'index': index, 'pre': img_tensor[0:3], 'post': img_tensor[3:6], 'size': pre_img.shape[:2]}
+        if self.keep_raw:
+            item['raw'] = (pre_img, post_img)
+        return item
+
+
+def collate_pairs(items):
+    """拼接成功读取的样本，读取失败的样本单独返回"""
+    ok = [item for item in items if 'error' not in item]
+    batch = {'failed': [item for item in items if 'error' in item], 'index': [item['index'] for item in ok],
+             'size': [item['size'] for item in ok], 'raw': [item.get('raw') for item in ok]}
+    if ok:
+        batch['pre'] = torch.stack([item['pre'] for item in ok])
+        batch['post'] = torch.stack([item['post'] for item in ok])
+    return batch
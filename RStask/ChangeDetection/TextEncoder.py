@@ -0,0 +1,159 @@
+import os
+import re
+import threading
+import torch
+import torch.nn as nn
+
+# 常见变化描述短语，启动时预先编码并写入磁盘缓存
+PHRASE_BANK = [
+    "buildings have been constructed or demolished",
+    "new buildings have been constructed",
+    "buildings have been demolished",
+    "roads have been built",
+    "vegetation has been removed",
+    "trees have been planted",
+    "farmland has been converted to buildings",
+    "water area has changed",
+    "bare land has been developed",
+    "no change",
+    "An aerial image",
+]
+
+
+def normalize_caption(text):
+    """缓存键：小写、合并空白、去掉首尾空白与句末标点"""
+    return re.sub(r'\s+', ' ', text.strip().lower()).rstrip('.')
+
+
+class CLIPTextTower(nn.Module):
+    """只包含 CLIP 文本塔（token embedding / transformer / ln_final / text_projection），不加载图像塔"""
+    def __init__(self, state_dict):
+        super(CLIPTextTower, self).__init__()
+        from clip.model import Transformer, LayerNorm
+        width = state_dict["ln_final.weight"].shape[0]
+        layers = len(set(k.split(".")[2] for k in state_dict if k.startswith("transformer.resblocks")))
+        self.context_length = state_dict["positional_embedding"].shape[0]
+
+        self.token_embedding = nn.Embedding(state_dict["token_embedding.weight"].shape[0], width)
+        self.positional_embedding = nn.Parameter(torch.empty(self.context_length, width))
+        self.transformer = Transformer(width=width, layers=layers, heads=width // 64,
+                                       attn_mask=self.build_attention_mask())
+        self.ln_final = LayerNorm(width)
+        self.text_projection = nn.Parameter(torch.empty(width, state_dict["text_projection"].shape[1]))
+
+        prefixes = ("token_embedding.", "positional_embedding", "transformer.", "ln_final.", "text_projection")
+        self.load_state_dict({k: v.float() for k, v in state_dict.items() if k.startswith(prefixes)})
+
+    def build_attention_mask(self):
+        # 与 CLIP 相同的因果注意力掩膜
+        mask = torch.empty(self.context_length, self.context_length)
+        mask.fill_(float("-inf"))
+        mask.triu_(1)
+        return mask
+
+    @property
+    def dtype(self):
+        return self.token_embedding.weight.dtype
+
+    def forward(self, tokens):
+        x = self.token_embedding(tokens).type(self.dtype)
+        x = x + self.positional_embedding.type(self.dtype)
+        x = x.permute(1, 0, 2)  # NLD -> LND
+        x = self.transformer(x)
+        x = x.permute(1, 0, 2)  # LND -> NLD
+        x = self.ln_final(x).type(self.dtype)
+        # 取每个序列 EOT token（编号最大）处的特征
+        return x[torch.arange(x.shape[0]), tokens.argmax(dim=-1)] @ self.text_projection
+
+
+def load_text_tower(name="ViT-B/32", device="cpu", download_root=None):
+    """读取 CLIP 权重，只构建文本塔；GPU 上与 clip.load 一样使用 fp16"""
+    # clip 包只导出 available_models / load / tokenize，下载表与下载函数在 clip.clip 模块中
+    from clip.clip import _MODELS, _download, available_models
+    if name in _MODELS:
+        model_path = _download(_MODELS[name], download_root or os.path.expanduser("~/.cache/clip"))
+    elif os.path.isfile(name):
+        model_path = name
+    else:
+        raise RuntimeError(f"Model {name} not found; available models = {available_models()}")
+
+    with open(model_path, 'rb') as opened_file:
+        try:
+            state_dict = torch.jit.load(opened_file, map_location="cpu").eval().state_dict()
+        except RuntimeError:
+            opened_file.seek(0)
+            state_dict = torch.load(opened_file, map_location="cpu")
+
+    tower = CLIPTextTower(state_dict).to(device).eval()
+    if 'cuda' in str(device):
+        tower = tower.half()
+    return tower
+
+
+class CachedTextEncoder:
+    """
+    带磁盘缓存的 CLIP 文本编码器
+
+    嵌入按规范化后的描述文本缓存在内存和磁盘中，文本塔只在遇到未缓存的描述时才加载。
+    """
+    def __init__(self, name="ViT-B/32", device="cpu", cache_path=None, phrase_bank=None):
+        self.name = name
+        self.device = device
+        self.cache_path = cache_path or os.path.join(
+            os.path.expanduser("~/.cache/clip"), "text_embeddings_" + name.replace('/', '-') + ".pt")
+        self.tower = None
+        self.lock = threading.Lock()
+        self.embeddings = self.load_cache()
+        self.warmup(PHRASE_BANK if phrase_bank is None else phrase_bank)
+
+    def load_cache(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            return torch.load(self.cache_path, map_location='cpu')
+        except Exception as e:
+            print(f"Ignoring unreadable text embedding cache {self.cache_path}: {e}")
+            return {}
+
+    def save_cache(self):
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        tmp_path = self.cache_path + '.tmp'
+        torch.save(self.embeddings, tmp_path)
+        os.replace(tmp_path, self.cache_path)
+
+    def get_tower(self):
+        if self.tower is None:
+            print(f"Loading CLIP text encoder {self.name}...")
+            self.tower = load_text_tower(self.name, self.device)
+        return self.tower
+
+    def warmup(self, phrases):
+        """预先编码短语库中尚未缓存的短语"""
+        if phrases:
+            self.encode(list(phrases))
+
+    def encode(self, texts):
+        """
+        编码文本
+
+        Args:
+            texts: 字符串或字符串列表
+
+        Returns:
+            features: [N, D] float32 CPU 张量
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        keys = [normalize_caption(t) for t in texts]
+        with self.lock:
+            missing = sorted(set(k for k in keys if k not in self.embeddings))
+            if missing:
+                # 只在有未缓存的描述时导入 clip
+                import clip
+                tokens = clip.tokenize(missing).to(self.device)
+                with torch.no_grad():
+                    features = self.get_tower()(tokens).float().cpu()
+                for key, feature in zip(missing, features):
+                    self.embeddings[key] = feature
+                self.save_cache()
+            return torch.stack([self.embeddings[k] for k in keys])
@@ -1,4 +1,10 @@
 # ChangeDetection module
-from .MMchange import MMChangeDetection
-
+# MMChangeDetection 依赖 torch / CLIP 等，按需在首次访问时导入
 __all__ = ['MMChangeDetection']
+
+
+def __getattr__(name):
+    if name == 'MMChangeDetection':
+        from .MMchange import MMChangeDetection
+        return MMChangeDetection
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
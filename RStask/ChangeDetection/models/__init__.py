@@ -1 +1,3 @@
-from models import *
+from .model import BaseNet, BaseNet_Hybrid
+
+__all__ = ['BaseNet', 'BaseNet_Hybrid']
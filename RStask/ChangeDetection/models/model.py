@@ -667,11 +667,16 @@ class Image_encoder(nn.Module):
         channles = [16, 24, 32, 96, 320]
         self.backbone = Resnet50()
         self.fe = Feature_extraction(channles, self.mid_d)
+    def encode(self, x):
+        """单时相编码，返回特征金字塔 (s2, s3, s4, s5)，可按时相缓存复用"""
+        x_1, x_2, x_3, x_4, x_5 = self.backbone(x)
+        return self.fe(x_2, x_3, x_4, x_5)
+
     def forward(self, x1, x2):
-        x1_1, x1_2, x1_3, x1_4, x1_5 = self.backbone(x1)
-        x2_1, x2_2, x2_3, x2_4, x2_5 = self.backbone(x2)
-        x1_2, x1_3, x1_4, x1_5 = self.fe(x1_2, x1_3, x1_4, x1_5)
-        x2_2, x2_3, x2_4, x2_5 = self.fe(x2_2, x2_3, x2_4, x2_5)
+        # 孪生分支共享权重：前后时相沿 batch 维拼接后只运行一次 backbone，再按时相拆分
+        feats = self.encode(torch.cat([x1, x2], dim=0))
+        x1_2, x1_3, x1_4, x1_5 = (f[:x1.shape[0]] for f in feats)
+        x2_2, x2_3, x2_4, x2_5 = (f[x1.shape[0]:] for f in feats)
         return x1_2, x1_3, x1_4, x1_5, x2_2, x2_3, x2_4, x2_5
 
 class Feature_refinement(nn.Module):
@@ -740,6 +745,39 @@ class IFR(nn.Module):
         c4_2 = self.enh(c4)
         c5_2 = self.enh(c5)
         return c2_2, c3_2, c4_2, c5_2
+def change_maps(mask_p2, mask_p3, mask_p4, mask_p5, inference=False, logits=False):
+    """
+    把解码器各层输出转换为变化图
+
+    训练时四个深监督输出都上采样到原分辨率并做 sigmoid；推理时只用到最终的 mask_p2，
+    inference=True 时跳过 p3 ~ p5 的上采样与 sigmoid。
+
+    Args:
+        mask_p2 ~ mask_p5: 解码器输出的 1/4 ~ 1/32 分辨率 logits
+        inference: 只返回最终变化图 mask_p2
+        logits: 推理模式下返回 1/4 分辨率的 logits，由调用方合并上采样与阈值化（logits > 0 等价于概率 > 0.5）
+
+    Returns:
+        训练模式返回 (mask_p2, mask_p3, mask_p4, mask_p5) 四个原分辨率概率图，推理模式返回单个张量
+    """
+    if inference:
+        if logits:
+            return mask_p2
+        return torch.sigmoid(F.interpolate(mask_p2, scale_factor=(4, 4), mode='bilinear'))
+
+    # change map
+    mask_p2 = F.interpolate(mask_p2, scale_factor=(4, 4), mode='bilinear')
+    mask_p2 = torch.sigmoid(mask_p2)
+    mask_p3 = F.interpolate(mask_p3, scale_factor=(8, 8), mode='bilinear')
+    mask_p3 = torch.sigmoid(mask_p3)
+    mask_p4 = F.interpolate(mask_p4, scale_factor=(16, 16), mode='bilinear')
+    mask_p4 = torch.sigmoid(mask_p4)
+    mask_p5 = F.interpolate(mask_p5, scale_factor=(32, 32), mode='bilinear')
+    mask_p5 = torch.sigmoid(mask_p5)
+
+    return mask_p2, mask_p3, mask_p4, mask_p5
+
+
 class BaseNet(nn.Module):
     def __init__(self, input_nc=3, output_nc=1, use_change_caption=False):
         super(BaseNet, self).__init__()
@@ -763,8 +801,22 @@ class BaseNet(nn.Module):
             
         self.ITFF = ITFF(self.en_d * 2)
         
-    def forward(self, x1, x2, text_A, text_B=None):
+    def forward(self, x1, x2, text_A, text_B=None, inference=False, logits=False):
         x1_2, x1_3, x1_4, x1_5, x2_2, x2_3, x2_4, x2_5 = self.Image_encoder(x1,x2)
+        return self.forward_features((x1_2, x1_3, x1_4, x1_5), (x2_2, x2_3, x2_4, x2_5), text_A, text_B,
+                                     inference, logits)
+
+    def forward_features(self, feats1, feats2, text_A, text_B=None, inference=False, logits=False):
+        """
+        在已编码的时相特征上运行变化检测头（IFR / TDE / ITFF / Decoder）
+
+        Args:
+            feats1, feats2: Image_encoder.encode 输出的前后时相特征金字塔
+            text_A, text_B: 文本特征，含义同 forward
+            inference, logits: 推理模式开关，见 change_maps
+        """
+        x1_2, x1_3, x1_4, x1_5 = feats1
+        x2_2, x2_3, x2_4, x2_5 = feats2
 
         c2_2,c3_2,c4_2,c5_2 = self.IFR(x1_2, x1_3, x1_4, x1_5, x2_2, x2_3, x2_4, x2_5)
 
@@ -784,17 +836,7 @@ class BaseNet(nn.Module):
 
         p2, p3, p4, p5, mask_p2, mask_p3, mask_p4, mask_p5 = self.decoder(tc2, tc3, tc4, tc5)
 
-        # change map
-        mask_p2 = F.interpolate(mask_p2, scale_factor=(4, 4), mode='bilinear')
-        mask_p2 = torch.sigmoid(mask_p2)
-        mask_p3 = F.interpolate(mask_p3, scale_factor=(8, 8), mode='bilinear')
-        mask_p3 = torch.sigmoid(mask_p3)
-        mask_p4 = F.interpolate(mask_p4, scale_factor=(16, 16), mode='bilinear')
-        mask_p4 = torch.sigmoid(mask_p4)
-        mask_p5 = F.interpolate(mask_p5, scale_factor=(32, 32), mode='bilinear')
-        mask_p5 = torch.sigmoid(mask_p5)
-
-        return mask_p2, mask_p3, mask_p4, mask_p5
+        return change_maps(mask_p2, mask_p3, mask_p4, mask_p5, inference, logits)
 
 # 方案3: 使用混合TDE的模型
 class BaseNet_Hybrid(nn.Module):
@@ -811,14 +853,23 @@ class BaseNet_Hybrid(nn.Module):
         self.TDE = TDE_Hybrid(self.en_d*2)
         self.ITFF = ITFF(self.en_d * 2)
         
-    def forward(self, x1, x2, change_text, text_A=None, text_B=None):
+    def forward(self, x1, x2, change_text, text_A=None, text_B=None, inference=False, logits=False):
         """
         Args:
             x1, x2: 前后时相图像
             change_text: 变化描述文本特征
             text_A, text_B: 可选的前后时相独立描述
+            inference, logits: 推理模式开关，见 change_maps
         """
         x1_2, x1_3, x1_4, x1_5, x2_2, x2_3, x2_4, x2_5 = self.Image_encoder(x1,x2)
+        return self.forward_features((x1_2, x1_3, x1_4, x1_5), (x2_2, x2_3, x2_4, x2_5),
+                                     change_text, text_A, text_B, inference, logits)
+
+    def forward_features(self, feats1, feats2, change_text, text_A=None, text_B=None, inference=False,
+                         logits=False):
+        """在已编码的时相特征上运行变化检测头，参数含义同 forward"""
+        x1_2, x1_3, x1_4, x1_5 = feats1
+        x2_2, x2_3, x2_4, x2_5 = feats2
 
         c2_2,c3_2,c4_2,c5_2 = self.IFR(x1_2, x1_3, x1_4, x1_5, x2_2, x2_3, x2_4, x2_5)
 
@@ -832,14 +883,4 @@ class BaseNet_Hybrid(nn.Module):
 
         p2, p3, p4, p5, mask_p2, mask_p3, mask_p4, mask_p5 = self.decoder(tc2, tc3, tc4, tc5)
 
-        # change map
-        mask_p2 = F.interpolate(mask_p2, scale_factor=(4, 4), mode='bilinear')
-        mask_p2 = torch.sigmoid(mask_p2)
-        mask_p3 = F.interpolate(mask_p3, scale_factor=(8, 8), mode='bilinear')
-        mask_p3 = torch.sigmoid(mask_p3)
-        mask_p4 = F.interpolate(mask_p4, scale_factor=(16, 16), mode='bilinear')
-        mask_p4 = torch.sigmoid(mask_p4)
-        mask_p5 = F.interpolate(mask_p5, scale_factor=(32, 32), mode='bilinear')
-        mask_p5 = torch.sigmoid(mask_p5)
-
-        return mask_p2, mask_p3, mask_p4, mask_p5
+        return change_maps(mask_p2, mask_p3, mask_p4, mask_p5, inference, logits)
@@ -1,6 +1,7 @@
-from PIL import Image
 import cv2
 import numpy as np
+from RStask.Common.TileExecutor import TileExecutor, DEFAULT_TILE_SIZE, open_raster
+from RStask.Common.OutputWriter import write_output
 
 class DarkChannelCloudRemoval:
     """基于暗通道先验的云雾去除算法"""
@@ -9,6 +10,18 @@ class DarkChannelCloudRemoval:
         self.omega = 0.95  # 去雾程度
         self.t0 = 0.1      # 最小透射率
         self.radius = 15   # 暗通道窗口半径
+        self.guided_radius = 60  # 导向滤波窗口
+        self.guided_eps = 0.0001
+        self.subsample = 4  # 快速导向滤波的降采样倍数
+        self.tile_size = DEFAULT_TILE_SIZE
+        self.atmosphere_side = 2048  # 切片执行时估计全局大气光所用缩略图的最长边
+
+    @property
+    def tile_halo(self):
+        # 透射率暗通道腐蚀半径 + 导向滤波两次盒滤波 + 降采样插值余量，按降采样倍数对齐使各切片的降采样网格一致
+        s = max(self.subsample, 1)
+        halo = self.radius // 2 + self.guided_radius + 2 * s
+        return int(np.ceil(halo / s)) * s
         
     def get_dark_channel(self, img, size=15):
         """计算暗通道"""
@@ -18,8 +31,27 @@ class DarkChannelCloudRemoval:
         dark = cv2.erode(min_img, kernel)
         return dark
     
+    def get_cloud_mask(self, img, threshold=0.6, size=None, dilate=15):
+        """
+        基于暗通道估计云 / 厚雾掩膜：云在各通道都很亮，暗通道值高
+
+        Args:
+            img: [H, W, 3] uint8 图像（通道顺序不影响结果）或 [0, 1] 浮点图像
+            threshold: 暗通道阈值（相对于满量程）
+            size: 暗通道窗口大小，默认为 self.radius
+            dilate: 掩膜膨胀的窗口大小，用于覆盖云的边缘，0 表示不膨胀
+
+        Returns:
+            mask: [H, W] 布尔云掩膜
+        """
+        scale = 255 if img.dtype == np.uint8 else 1.0
+        mask = (self.get_dark_channel(img, size or self.radius) > threshold * scale).astype(np.uint8)
+        if dilate:
+            mask = cv2.dilate(mask, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (dilate, dilate)))
+        return mask > 0
+
     def get_atmosphere(self, img, dark):
-        """估计大气光值"""
+        """估计大气光值：取暗通道最亮的 0.1% 像素的均值（argpartition 选出，无需全排序）"""
         h, w = img.shape[:2]
         num_pixels = h * w
         num_brightest = int(max(num_pixels * 0.001, 1))
@@ -27,76 +59,142 @@ class DarkChannelCloudRemoval:
         dark_vec = dark.reshape(num_pixels)
         img_vec = img.reshape(num_pixels, 3)
         
-        indices = dark_vec.argsort()[-num_brightest:]
+        indices = np.argpartition(dark_vec, num_pixels - num_brightest)[-num_brightest:]
         brightest_pixels = img_vec[indices]
         
-        atmosphere = np.mean(brightest_pixels, axis=0)
+        atmosphere = np.mean(brightest_pixels, axis=0, dtype=np.float64).astype(np.float32)
         return atmosphere
     
     def get_transmission(self, img, atmosphere):
         """估计透射率"""
-        norm_img = np.empty_like(img, dtype=np.float64)
-        for i in range(3):
-            norm_img[:, :, i] = img[:, :, i] / atmosphere[i]
-        
+        norm_img = img / atmosphere.reshape(1, 1, 3)
         transmission = 1 - self.omega * self.get_dark_channel(norm_img, self.radius)
         return transmission
     
     def guided_filter(self, I, p, r, eps):
         """导向滤波"""
-        mean_I = cv2.boxFilter(I, cv2.CV_64F, (r, r))
-        mean_p = cv2.boxFilter(p, cv2.CV_64F, (r, r))
-        mean_Ip = cv2.boxFilter(I * p, cv2.CV_64F, (r, r))
+        mean_I = cv2.boxFilter(I, cv2.CV_32F, (r, r))
+        mean_p = cv2.boxFilter(p, cv2.CV_32F, (r, r))
+        mean_Ip = cv2.boxFilter(I * p, cv2.CV_32F, (r, r))
         cov_Ip = mean_Ip - mean_I * mean_p
         
-        mean_II = cv2.boxFilter(I * I, cv2.CV_64F, (r, r))
+        mean_II = cv2.boxFilter(I * I, cv2.CV_32F, (r, r))
         var_I = mean_II - mean_I * mean_I
         
         a = cov_Ip / (var_I + eps)
         b = mean_p - a * mean_I
         
-        mean_a = cv2.boxFilter(a, cv2.CV_64F, (r, r))
-        mean_b = cv2.boxFilter(b, cv2.CV_64F, (r, r))
+        mean_a = cv2.boxFilter(a, cv2.CV_32F, (r, r))
+        mean_b = cv2.boxFilter(b, cv2.CV_32F, (r, r))
         
         q = mean_a * I + mean_b
         return q
+
+    def fast_guided_filter(self, I, p, r, eps, s=None):
+        """
+        快速导向滤波：在降采样 s 倍的引导图上求线性系数，再把系数双线性上采样回原分辨率
+
+        Args:
+            I: [H, W] float32 引导图
+            p: [H, W] float32 待滤波图
+            r: 原分辨率下的窗口大小
+            eps: 正则项
+            s: 降采样倍数，默认为 self.subsample；为 1 时等价于 guided_filter
+        """
+        s = s or self.subsample
+        if s <= 1:
+            return self.guided_filter(I, p, r, eps)
+        h, w = I.shape[:2]
+        size = (max(w // s, 1), max(h // s, 1))
+        I_small = cv2.resize(I, size, interpolation=cv2.INTER_AREA)
+        p_small = cv2.resize(p, size, interpolation=cv2.INTER_AREA)
+        r_small = max(int(round(r / s)), 1)
+
+        mean_I = cv2.boxFilter(I_small, cv2.CV_32F, (r_small, r_small))
+        mean_p = cv2.boxFilter(p_small, cv2.CV_32F, (r_small, r_small))
+        cov_Ip = cv2.boxFilter(I_small * p_small, cv2.CV_32F, (r_small, r_small)) - mean_I * mean_p
+        var_I = cv2.boxFilter(I_small * I_small, cv2.CV_32F, (r_small, r_small)) - mean_I * mean_I
+
+        a = cov_Ip / (var_I + eps)
+        b = mean_p - a * mean_I
+        mean_a = cv2.resize(cv2.boxFilter(a, cv2.CV_32F, (r_small, r_small)), (w, h), interpolation=cv2.INTER_LINEAR)
+        mean_b = cv2.resize(cv2.boxFilter(b, cv2.CV_32F, (r_small, r_small)), (w, h), interpolation=cv2.INTER_LINEAR)
+        return mean_a * I + mean_b
     
     def recover(self, img, transmission, atmosphere):
-        """恢复去云图像"""
-        result = np.empty_like(img, dtype=np.float64)
-        transmission = np.maximum(transmission, self.t0)
-        
-        for i in range(3):
-            result[:, :, i] = (img[:, :, i] - atmosphere[i]) / transmission + atmosphere[i]
-        
+        """恢复去云图像（按通道广播，原地运算避免中间数组）"""
+        transmission = np.maximum(transmission, self.t0)[:, :, None]
+        atmosphere = atmosphere.reshape(1, 1, 3)
+        result = np.subtract(img, atmosphere)
+        result /= transmission
+        result += atmosphere
         return result
 
-    def inference(self, inputs, new_image_name):
-        """执行云雾去除"""
-        image = Image.open(inputs)
-        img = np.array(image).astype(np.float64) / 255.0
-        
-        # 计算暗通道
-        dark = self.get_dark_channel(img, self.radius)
-        
-        # 估计大气光
-        atmosphere = self.get_atmosphere(img, dark)
+    def estimate_atmosphere(self, image, max_side=None):
+        """
+        在缩略图上估计全局大气光，供切片执行时各切片共用
+
+        Args:
+            image: [H, W, 3] uint8 数组（可为内存映射）
+            max_side: 缩略图最长边，默认为 self.atmosphere_side
+        """
+        max_side = max_side or self.atmosphere_side
+        h, w = image.shape[:2]
+        factor = max(h, w) / max_side
+        if factor > 1:
+            image = cv2.resize(np.asarray(image), (max(int(w / factor), 1), max(int(h / factor), 1)),
+                               interpolation=cv2.INTER_AREA)
+        dark = self.get_dark_channel(image, self.radius)
+        return self.get_atmosphere(image.astype(np.float32) / 255.0, dark)
+
+    def process(self, image, atmosphere=None):
+        """
+        对内存中的 RGB 图像去云雾
+
+        Args:
+            image: [H, W, 3] uint8 数组
+            atmosphere: 可选的大气光 [3]，为空时在该图像上估计
+
+        Returns:
+            result: [H, W, 3] uint8 数组
+        """
+        img = image.astype(np.float32) / 255.0
+        
+        if atmosphere is None:
+            # 计算暗通道（uint8 上计算，排序与浮点结果一致）
+            dark = self.get_dark_channel(image, self.radius)
+
+            # 估计大气光
+            atmosphere = self.get_atmosphere(img, dark)
         
         # 估计透射率
         transmission = self.get_transmission(img, atmosphere)
         
-        # 使用导向滤波优化透射率
-        gray = cv2.cvtColor((img * 255).astype(np.uint8), cv2.COLOR_RGB2GRAY).astype(np.float64) / 255.0
-        transmission = self.guided_filter(gray, transmission, r=60, eps=0.0001)
+        # 使用快速导向滤波优化透射率
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY).astype(np.float32) / 255.0
+        transmission = self.fast_guided_filter(gray, transmission, r=self.guided_radius, eps=self.guided_eps)
         
         # 恢复图像
         result = self.recover(img, transmission, atmosphere)
-        
-        # 转换回uint8并保存
-        result = np.clip(result * 255, 0, 255).astype(np.uint8)
-        result_image = Image.fromarray(result)
-        result_image.save(new_image_name)
+        result *= 255
+        return np.clip(result, 0, 255, out=result).astype(np.uint8)
+
+    def inference(self, inputs, new_image_name, tile_size=None):
+        """
+        执行云雾去除
+
+        Args:
+            inputs: 输入图像路径（.npy 以内存映射读取）
+            new_image_name: 输出图像路径
+            tile_size: 切片大小，最长边超过该值时按切片执行（大气光在缩略图上全局估计），默认为 self.tile_size
+        """
+        image = open_raster(inputs, mode='RGB')
+        executor = TileExecutor(tile_size or self.tile_size, halo=self.tile_halo)
+        if executor.needs_tiling(image.shape):
+            atmosphere = self.estimate_atmosphere(image)
+            executor.write(image, lambda tile, size: self.process(tile, atmosphere), new_image_name)
+        else:
+            write_output(self.process(np.ascontiguousarray(image)), new_image_name)
         
         print(f"\nProcessed CloudRemoval, Input Image: {inputs}, Output Image: {new_image_name}")
         return None
-
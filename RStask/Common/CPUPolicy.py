@@ -0,0 +1,120 @@
+import os
+import threading
+import cv2
+
+
+def available_cpus():
+    """当前进程可用的 CPU 核数（考虑 CPU 亲和性 / 容器限制）"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def env_int(name, default=None):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+class CPUPolicy:
+    """
+    CPU 执行策略：统一设置 OpenCV 与 PyTorch 的线程数，避免两个线程池在并发请求下超额订阅
+
+    每个并发请求分到 available_cpus() // concurrency 个线程。同一请求中的 OpenCV 与 PyTorch 调用可能在不同线程上
+    同时运行（如流水线各阶段、后台任务），因此默认把这一份预算拆开：OpenCV 取一半，PyTorch 取剩余部分，
+    两者之和不超过预算（预算只有 1 个线程时各取 1 个）；只给出其中一个时，另一个取预算的剩余部分。
+    PyTorch 的 interop 线程池默认只保留 1 个线程。use_umat 打开后，支持 T-API 的 OpenCV 调用改用 cv2.UMat，
+    在没有 OpenCL 设备时 UMat 自动回退到 CPU 实现，结果不变。
+
+    Args:
+        concurrency: 预期的并发请求数
+        cv2_threads: OpenCV 线程数，默认为预算的一半
+        torch_threads: PyTorch intra-op 线程数，默认为预算减去 cv2_threads
+        torch_interop_threads: PyTorch inter-op 线程数
+        use_umat: 是否使用 cv2.UMat 执行
+        opencl: use_umat 时是否允许 OpenCL（False 时 UMat 只走 CPU 回退路径）
+    """
+    def __init__(self, concurrency=1, cv2_threads=None, torch_threads=None, torch_interop_threads=1,
+                 use_umat=False, opencl=True):
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be >= 1, got {concurrency}")
+        budget = max(available_cpus() // concurrency, 1)
+        self.concurrency = concurrency
+        if cv2_threads is None and torch_threads is None:
+            cv2_threads = max(budget // 2, 1)
+        if cv2_threads is None:
+            cv2_threads = max(budget - torch_threads, 1)
+        self.cv2_threads = cv2_threads
+        self.torch_threads = torch_threads or max(budget - cv2_threads, 1)
+        self.torch_interop_threads = torch_interop_threads
+        self.use_umat = use_umat
+        self.opencl = opencl
+
+    @classmethod
+    def from_env(cls, concurrency=None):
+        """从环境变量 RSAGENT_CONCURRENCY / RSAGENT_CV2_THREADS / RSAGENT_TORCH_THREADS / RSAGENT_UMAT 读取策略"""
+        return cls(concurrency=concurrency or env_int('RSAGENT_CONCURRENCY', 1),
+                   cv2_threads=env_int('RSAGENT_CV2_THREADS'),
+                   torch_threads=env_int('RSAGENT_TORCH_THREADS'),
+                   use_umat=os.environ.get('RSAGENT_UMAT', '').lower() in ('1', 'true', 'yes'))
+
+    def apply(self):
+        """把策略应用到当前进程；torch 未安装时只设置 OpenCV"""
+        global _policy
+        cv2.setNumThreads(self.cv2_threads)
+        cv2.ocl.setUseOpenCL(self.use_umat and self.opencl)
+        try:
+            import torch
+        except ImportError:
+            torch = None
+        if torch is not None:
+            torch.set_num_threads(self.torch_threads)
+            try:
+                torch.set_num_interop_threads(self.torch_interop_threads)
+            except RuntimeError:
+                # interop 线程池在首次并行计算后不能再修改
+                pass
+        with _lock:
+            _policy = self
+        return self
+
+    def worker(self):
+        """进程池 worker 的策略：并行度由进程数提供，每个 worker 单线程"""
+        return CPUPolicy(concurrency=self.concurrency, cv2_threads=1, torch_threads=1, torch_interop_threads=1,
+                         use_umat=self.use_umat, opencl=self.opencl)
+
+    def __repr__(self):
+        return (f"CPUPolicy(concurrency={self.concurrency}, cv2_threads={self.cv2_threads}, "
+                f"torch_threads={self.torch_threads}, torch_interop_threads={self.torch_interop_threads}, "
+                f"use_umat={self.use_umat})")
+
+
+_lock = threading.Lock()
+_policy = None
+
+
+def get_policy():
+    """当前进程生效的策略，未设置时返回默认策略（不修改线程设置）"""
+    return _policy or CPUPolicy()
+
+
+def apply_policy(concurrency=None, **kwargs):
+    """创建并应用策略：给出线程参数时按参数创建，否则从环境变量读取"""
+    if kwargs:
+        return CPUPolicy(concurrency=concurrency or 1, **kwargs).apply()
+    return CPUPolicy.from_env(concurrency).apply()
+
+
+def init_worker(policy=None):
+    """ProcessPoolExecutor 的 initializer：应用单线程 worker 策略（通过 initargs 传入父进程的 policy.worker()）"""
+    (policy or get_policy().worker()).apply()
+
+
+def to_device(img):
+    """启用 UMat 时把数组包装为 cv2.UMat，否则原样返回"""
+    return cv2.UMat(img) if get_policy().use_umat else img
+
+
+def to_array(img):
+    """cv2.UMat 转回 numpy 数组"""
+    return img.get() if isinstance(img, cv2.UMat) else img
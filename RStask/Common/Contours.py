@@ -0,0 +1,203 @@
+import cv2
+import numpy as np
+from RStask.Common.FeatureCache import FeatureCache, array_hash
+from RStask.Common.CPUPolicy import to_device, to_array
+
+# 边缘 / 轮廓结果缓存，与 backbone 特征缓存分开，互不挤占
+contour_cache = FeatureCache(max_bytes=256 << 20, max_entries=32)
+
+
+def to_gray(img):
+    """RGB / RGBA 转灰度，灰度图原样返回"""
+    if img.ndim == 2:
+        return img
+    code = cv2.COLOR_RGBA2GRAY if img.shape[2] == 4 else cv2.COLOR_RGB2GRAY
+    return cv2.cvtColor(img, code)
+
+
+def stack_contours(contours):
+    """把轮廓列表拼接为 [M, 2] 顶点数组，返回顶点与每个轮廓的起始下标"""
+    lengths = np.array([len(c) for c in contours], dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    points = np.concatenate([c.reshape(-1, 2) for c in contours]).astype(np.float64)
+    return points, starts, lengths
+
+
+def contour_areas(contours):
+    """
+    批量计算轮廓面积（鞋带公式，与 cv2.contourArea 结果一致），所有轮廓一次向量化完成
+
+    Returns:
+        areas: [N] float64
+    """
+    if len(contours) == 0:
+        return np.zeros(0, dtype=np.float64)
+    points, starts, lengths = stack_contours(contours)
+    # 每个顶点的下一个顶点，轮廓最后一个顶点回到起点
+    nxt = np.arange(1, len(points) + 1)
+    nxt[starts + lengths - 1] = starts
+    cross = points[:, 0] * points[nxt, 1] - points[nxt, 0] * points[:, 1]
+    return np.abs(np.add.reduceat(cross, starts)) / 2
+
+
+def bounding_boxes(contours):
+    """批量计算轮廓的水平外接框（与 cv2.boundingRect 一致），返回 [N, 4] 的 (x, y, w, h)"""
+    if len(contours) == 0:
+        return np.zeros((0, 4), dtype=np.int64)
+    points, starts, _ = stack_contours(contours)
+    points = points.astype(np.int64)
+    lo = np.minimum.reduceat(points, starts)
+    hi = np.maximum.reduceat(points, starts)
+    return np.concatenate([lo, hi - lo + 1], axis=1)
+
+
+def detect_edges(img, low, high, blur=0, gray=False, image_hash=None, use_cache=True):
+    """
+    Canny 边缘检测（带缓存）
+
+    Args:
+        img: [H, W] 或 [H, W, C] uint8 数组
+        low, high: Canny 滞后阈值
+        blur: 高斯模糊核大小，0 表示不模糊
+        gray: 是否先转为灰度（否则多通道图像取各通道最大梯度）
+        image_hash: 可选的图像哈希，已计算过时传入避免重复哈希
+        use_cache: 是否读写 contour_cache
+
+    Returns:
+        edges: [H, W] uint8 边缘图（只读，调用方需要修改时先复制）
+    """
+    def compute():
+        src = to_device(to_gray(img) if gray else img)
+        if blur:
+            src = cv2.GaussianBlur(src, (blur, blur), 0)
+        edges = to_array(cv2.Canny(src, low, high))
+        edges.flags.writeable = False
+        return edges
+
+    if not use_cache:
+        return compute()
+    key = ('edges', image_hash or array_hash(img), low, high, blur, gray)
+    return contour_cache.get_or_compute(key, compute)
+
+
+def to_uint8(img):
+    """非 8 位图像（如 16 位 / 浮点遥感影像）按最小 / 最大值线性拉伸到 uint8，uint8 原样返回"""
+    if img.dtype == np.uint8:
+        return img
+    img = np.asarray(img, dtype=np.float32)
+    lo, hi = float(img.min()), float(img.max())
+    scale = 255.0 / (hi - lo) if hi > lo else 0.0
+    return ((img - lo) * scale).astype(np.uint8)
+
+
+def gray_histogram(img, rows=1024):
+    """按行分块累计灰度直方图，大影像（含内存映射）不需要整幅灰度图"""
+    hist = np.zeros(256, dtype=np.int64)
+    for y in range(0, img.shape[0], rows):
+        gray = to_gray(np.ascontiguousarray(img[y:y + rows]))
+        hist += np.bincount(gray.ravel(), minlength=256)
+    return hist
+
+
+def median_from_histogram(hist):
+    return int(np.searchsorted(np.cumsum(hist), hist.sum() / 2))
+
+
+def otsu_from_histogram(hist):
+    """在直方图上求 Otsu 阈值（与 cv2.THRESH_OTSU 一致）"""
+    p = hist / max(hist.sum(), 1)
+    omega = np.cumsum(p)
+    mu = np.cumsum(p * np.arange(256))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma_b = (mu[-1] * omega - mu) ** 2 / (omega * (1 - omega))
+    return int(np.argmax(np.nan_to_num(sigma_b)))
+
+
+def auto_thresholds(img=None, mode='median', sigma=0.33, hist=None):
+    """
+    由灰度统计自动确定 Canny 阈值，直方图只统计一次
+
+    Args:
+        img: [H, W] 或 [H, W, C] uint8 数组（给出 hist 时可为空）
+        mode: 'median'（中值 * (1 -/+ sigma)）或 'otsu'（Otsu 阈值为高阈值，一半为低阈值）
+        sigma: median 模式的相对宽度
+        hist: 可选的预先计算的灰度直方图
+
+    Returns:
+        (low, high)
+    """
+    hist = gray_histogram(img) if hist is None else hist
+    if mode == 'median':
+        v = median_from_histogram(hist)
+        return int(max(0, (1.0 - sigma) * v)), int(min(255, (1.0 + sigma) * v))
+    if mode == 'otsu':
+        high = otsu_from_histogram(hist)
+        return high // 2, high
+    raise ValueError(f"Unknown threshold mode {mode!r}, expected 'median' or 'otsu'")
+
+
+def build_pyramid(img, levels, image_hash=None, use_cache=True):
+    """高斯金字塔（第 0 层为原图），按图像哈希缓存，多尺度边缘在不同阈值下复用同一金字塔"""
+    def compute():
+        pyramid = [img]
+        for _ in range(levels - 1):
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+        return pyramid
+
+    if not use_cache or levels <= 1:
+        return compute()
+    key = ('pyramid', image_hash or array_hash(img), levels)
+    return contour_cache.get_or_compute(key, compute)
+
+
+def multiscale_edges(img, low, high, levels=3, image_hash=None, use_cache=True):
+    """
+    多尺度 Canny：在金字塔各层上用同一组阈值检测边缘，最近邻放大回原尺寸后取并集，
+    粗尺度层补充细节层中被纹理噪声打断的大结构边缘
+
+    Returns:
+        edges: [H, W] uint8 边缘图
+    """
+    h, w = img.shape[:2]
+    image_hash = image_hash or (array_hash(img) if use_cache else None)
+    pyramid = build_pyramid(img, levels, image_hash=image_hash, use_cache=use_cache)
+    edges = np.array(detect_edges(img, low, high, image_hash=image_hash, use_cache=use_cache))
+    for level in pyramid[1:]:
+        coarse = detect_edges(level, low, high, use_cache=False)
+        np.maximum(edges, cv2.resize(coarse, (w, h), interpolation=cv2.INTER_NEAREST), out=edges)
+    return edges
+
+
+def find_contours(img, low=50, high=150, blur=5, close=5, image_hash=None, use_cache=True):
+    """
+    共享的轮廓提取流程：灰度 -> 高斯模糊 -> Canny -> 形态学闭运算 -> 外轮廓，
+    结果按 (图像哈希, 参数) 缓存，水平框 / 旋转框等工具对同一幅图像只运行一次
+
+    Args:
+        img: [H, W] 或 [H, W, C] uint8 数组
+        low, high: Canny 滞后阈值
+        blur: 高斯模糊核大小
+        close: 闭运算核大小，0 表示不做闭运算
+        image_hash: 可选的图像哈希
+        use_cache: 是否读写 contour_cache
+
+    Returns:
+        result: {'edges': 闭运算后的边缘图, 'contours': 外轮廓列表, 'areas': [N] float64 轮廓面积}
+    """
+    image_hash = image_hash or (array_hash(img) if use_cache else None)
+
+    def compute():
+        edges = detect_edges(img, low, high, blur=blur, gray=True, image_hash=image_hash, use_cache=use_cache)
+        if close:
+            # 形态学操作，连接边缘
+            kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (close, close))
+            edges = to_array(cv2.morphologyEx(to_device(edges), cv2.MORPH_CLOSE, kernel))
+            edges.flags.writeable = False
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        areas = contour_areas(contours)
+        return {'edges': edges, 'contours': list(contours), 'areas': areas}
+
+    if not use_cache:
+        return compute()
+    key = ('contours', image_hash, low, high, blur, close)
+    return contour_cache.get_or_compute(key, compute)
@@ -0,0 +1,64 @@
+from functools import lru_cache
+import cv2
+import numpy as np
+from PIL import ImageDraw, ImageFont
+
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+
+
+@lru_cache(maxsize=8)
+def load_font(size=12, path=FONT_PATH):
+    """按 (字号, 路径) 缓存字体，每个进程只加载一次"""
+    try:
+        return ImageFont.truetype(path, size)
+    except (OSError, IOError):
+        return ImageFont.load_default()
+
+
+def draw_polygons(img, polygons, color, thickness=2):
+    """
+    一次 cv2.polylines 调用绘制全部闭合多边形（原地修改）
+
+    Args:
+        img: [H, W, 3] uint8 数组
+        polygons: [N, K, 2] 整型顶点数组或顶点数组列表
+        color: RGB 颜色
+        thickness: 线宽
+    """
+    if len(polygons):
+        cv2.polylines(img, [np.asarray(p, dtype=np.int32).reshape(-1, 1, 2) for p in polygons], True, color,
+                      thickness)
+    return img
+
+
+def draw_labels(image, labels, positions, color, size=12):
+    """
+    在 PIL 图像上批量绘制文字标签（共用一个 ImageDraw 与缓存字体）
+
+    Args:
+        image: PIL 图像（原地修改）
+        labels: 文本列表
+        positions: 与 labels 对应的 (x, y) 列表
+        color: 颜色
+        size: 字号
+    """
+    if labels:
+        draw = ImageDraw.Draw(image)
+        font = load_font(size)
+        for label, (x, y) in zip(labels, positions):
+            draw.text((int(x), int(y)), label, fill=color, font=font)
+    return image
+
+
+def boxes_to_polygons(boxes):
+    """[N, 4] 的 (x, y, w, h) 水平框转换为 [N, 4, 2] 顶点"""
+    boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    return np.stack([np.stack([x0, y0], 1), np.stack([x1, y0], 1), np.stack([x1, y1], 1),
+                     np.stack([x0, y1], 1)], 1)
+
+
+def to_rgb_array(image):
+    """PIL 图像转为可供 cv2 绘制的 [H, W, 3] uint8 数组"""
+    return np.array(image.convert('RGB') if image.mode != 'RGB' else image)
@@ -0,0 +1,97 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import torch
+
+
+def array_hash(array):
+    """计算图像数组的内容哈希（包含形状与数据类型）"""
+    array = np.ascontiguousarray(array)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str((array.shape, array.dtype.str)).encode())
+    h.update(memoryview(array).cast('B'))
+    return h.hexdigest()
+
+
+def nbytes(value):
+    """估算张量 / 数组及其嵌套容器占用的字节数"""
+    if isinstance(value, torch.Tensor):
+        return value.element_size() * value.nelement()
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(nbytes(v) for v in value.values())
+    return 0
+
+
+class FeatureCache:
+    """按 (图像哈希, backbone 标识, 输入尺寸) 缓存 backbone 多尺度特征，按 LRU 淘汰
+
+    同一会话中同一幅图像经过多个工具（或同一工具多次调用）时，只需运行各自的 head。
+    """
+    def __init__(self, max_bytes=1 << 30, max_entries=256):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(image_hash, backbone_id, input_size):
+        return image_hash, backbone_id, tuple(input_size)
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = nbytes(value)
+        with self.lock:
+            if size > self.max_bytes:
+                return value
+            if key in self.entries:
+                self.total_bytes -= self.sizes.pop(key)
+                del self.entries[key]
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.total_bytes += size
+            while self.entries and (self.total_bytes > self.max_bytes or len(self.entries) > self.max_entries):
+                old_key, _ = self.entries.popitem(last=False)
+                self.total_bytes -= self.sizes.pop(old_key)
+        return value
+
+    def get_or_compute(self, key, compute):
+        """命中则直接返回缓存，否则调用 compute() 计算并写入缓存"""
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, compute())
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return (f"FeatureCache(entries={len(self.entries)}, bytes={self.total_bytes}, "
+                f"hits={self.hits}, misses={self.misses})")
+
+
+# 进程内共享的特征缓存，各工具通过不同的 backbone 标识区分
+feature_cache = FeatureCache()
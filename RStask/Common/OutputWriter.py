@@ -0,0 +1,246 @@
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+import cv2
+import numpy as np
+from RStask.Common.CPUPolicy import available_cpus, env_int
+
+# 输出产品 -> 默认格式：image 为无损 PNG，preview 为有损预览，label 为原样写出的标签栅格（不做颜色转换）
+PRODUCT_FORMATS = {'image': '.png', 'preview': '.webp', 'label': '.png'}
+# 临时文件（编码中的输出、切片执行的中间内存映射）以该前缀命名，保留策略按年龄清理残留
+TEMP_PREFIX = '.rs_tmp_'
+
+
+def encode_params(ext, png_compression=1, jpeg_quality=85, webp_quality=80):
+    """按扩展名给出 cv2.imwrite 编码参数；PNG 默认使用快速压缩档（1），编码比默认档快数倍，文件略大"""
+    ext = ext.lower()
+    if ext == '.png':
+        return [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+    if ext in ('.jpg', '.jpeg'):
+        return [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+    if ext == '.webp':
+        return [cv2.IMWRITE_WEBP_QUALITY, webp_quality]
+    return []
+
+
+def temp_path(directory, suffix):
+    """在 directory 下生成临时文件路径（以 TEMP_PREFIX 开头，由保留策略清理）"""
+    return os.path.join(directory or '.', f"{TEMP_PREFIX}{uuid.uuid4().hex[:12]}{suffix}")
+
+
+class OutputWriter:
+    """
+    工具输出的编码服务：在后台线程池中编码并写出结果，请求线程提交后立即返回路径与 Future
+
+    编码先写到同目录的临时文件再原子替换，读取方不会看到写了一半的文件。提交的数组在写完之前不能再修改。
+    保留策略只作用于 root 目录（默认 image/）：超过 max_age 秒或超出 max_files 个的旧文件会被删除，
+    尚未写完的输出不会被删除；残留的临时文件超过 temp_age 秒后删除。
+
+    Args:
+        root: 受保留策略管理的输出目录
+        max_workers: 编码线程数（cv2 编码时释放 GIL）
+        max_pending: 同时未完成的写出任务上限，超过时提交会阻塞，限制排队数组占用的内存
+        max_files: root 下最多保留的文件数，None 表示不限
+        max_age: root 下文件的最长保留时间（秒），None 表示不限
+        temp_age: 残留临时文件的保留时间（秒）
+        png_compression: PNG 压缩级别（0-9）
+        jpeg_quality: JPEG 质量
+        webp_quality: WebP 质量
+    """
+    def __init__(self, root='image', max_workers=None, max_pending=8, max_files=None, max_age=None,
+                 temp_age=3600, png_compression=1, jpeg_quality=85, webp_quality=80, cleanup_interval=60):
+        self.root = root
+        self.max_workers = max_workers or max(1, min(4, available_cpus() // 2))
+        self.max_files = max_files
+        self.max_age = max_age
+        self.temp_age = temp_age
+        self.png_compression = png_compression
+        self.jpeg_quality = jpeg_quality
+        self.webp_quality = webp_quality
+        self.cleanup_interval = cleanup_interval
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='output-writer')
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.pending = {}  # 绝对路径 -> Future
+        self.last_cleanup = 0.0
+
+    @classmethod
+    def from_env(cls, root='image'):
+        """从环境变量 RSAGENT_WRITER_THREADS / RSAGENT_IMAGE_MAX_FILES / RSAGENT_IMAGE_MAX_AGE（小时）读取配置"""
+        max_age = env_int('RSAGENT_IMAGE_MAX_AGE')
+        return cls(root=root, max_workers=env_int('RSAGENT_WRITER_THREADS'),
+                   max_files=env_int('RSAGENT_IMAGE_MAX_FILES'), max_age=max_age * 3600 if max_age else None)
+
+    def resolve_path(self, path, product, fmt=None):
+        """fmt 给出时替换扩展名；路径没有扩展名时使用产品的默认格式"""
+        if product not in PRODUCT_FORMATS:
+            raise ValueError(f"Unknown output product {product!r}, expected one of {sorted(PRODUCT_FORMATS)}")
+        root, ext = os.path.splitext(path)
+        if fmt:
+            ext = fmt if fmt.startswith('.') else '.' + fmt
+        return root + (ext or PRODUCT_FORMATS[product])
+
+    def encode(self, array, path, product, bgr, params, remove):
+        try:
+            ext = os.path.splitext(path)[1].lower()
+            tmp = temp_path(os.path.dirname(path), ext)
+            try:
+                if ext == '.npy':
+                    # 原始栅格不编码，np.save 会按扩展名补全，这里直接写入文件对象
+                    with open(tmp, 'wb') as f:
+                        np.save(f, array)
+                else:
+                    if array.ndim == 3 and product != 'label' and not bgr:
+                        array = cv2.cvtColor(np.ascontiguousarray(array),
+                                             cv2.COLOR_RGBA2BGRA if array.shape[2] == 4 else cv2.COLOR_RGB2BGR)
+                    if params is None:
+                        params = encode_params(ext, self.png_compression, self.jpeg_quality, self.webp_quality)
+                    if not cv2.imwrite(tmp, array, params):
+                        raise IOError(f"Failed to encode {path}")
+                os.replace(tmp, path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+            return path
+        finally:
+            for p in remove:
+                if os.path.exists(p):
+                    os.remove(p)
+
+    def submit(self, array, path, product='image', fmt=None, bgr=False, params=None, remove=()):
+        """
+        提交写出任务
+
+        Args:
+            array: [H, W] 或 [H, W, C] 数组（可为内存映射），默认为 RGB 顺序
+            path: 输出路径，格式由扩展名决定（.png / .jpg / .webp / .tif / .npy）
+            product: 'image' 无损结果，'preview' 有损预览，'label' 标签栅格（原样写出，不做颜色转换）
+            fmt: 可选，替换 path 的扩展名（如 'webp'）
+            bgr: 数组是否已是 BGR 顺序
+            params: 可选的 cv2.imwrite 编码参数，默认按扩展名选择
+            remove: 写完后删除的文件（如切片执行的临时内存映射）
+
+        Returns:
+            path: 实际写出的路径
+            future: 写完后返回 path，编码失败时抛出异常
+        """
+        path = self.resolve_path(path, product, fmt)
+        key = os.path.abspath(path)
+        self.slots.acquire()
+        try:
+            future = self.pool.submit(self.encode, array, path, product, bgr, params, tuple(remove))
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.pending[key] = future
+        future.add_done_callback(lambda f: self.finish(key, f))
+        self.maybe_cleanup()
+        return path, future
+
+    def finish(self, key, future):
+        self.slots.release()
+        with self.lock:
+            if self.pending.get(key) is future:
+                del self.pending[key]
+        if not future.cancelled() and future.exception() is not None:
+            print(f"OutputWriter: failed to write {key}: {future.exception()}")
+
+    def write(self, array, path, product='image', fmt=None, bgr=False, params=None, remove=()):
+        """同步写出（提交后等待完成），返回实际路径"""
+        return self.submit(array, path, product, fmt=fmt, bgr=bgr, params=params, remove=remove)[1].result()
+
+    def wait(self, path=None, timeout=None):
+        """
+        等待写出完成；给出 path 时只等待该文件，否则等待全部未完成任务。编码失败不会在这里抛出（见 Future）
+
+        Returns:
+            done: 是否全部完成（超时返回 False）
+        """
+        with self.lock:
+            if path is None:
+                futures = list(self.pending.values())
+            else:
+                future = self.pending.get(os.path.abspath(path))
+                futures = [future] if future is not None else []
+        return not wait_futures(futures, timeout=timeout).not_done
+
+    def maybe_cleanup(self):
+        now = time.time()
+        if now - self.last_cleanup >= self.cleanup_interval:
+            self.last_cleanup = now
+            self.cleanup()
+
+    def cleanup(self):
+        """
+        按保留策略清理 root 目录
+
+        Returns:
+            removed: 删除的文件路径列表
+        """
+        if not os.path.isdir(self.root):
+            return []
+        now = time.time()
+        with self.lock:
+            busy = set(self.pending)
+        files, removed = [], []
+        for entry in os.scandir(self.root):
+            if not entry.is_file() or os.path.abspath(entry.path) in busy:
+                continue
+            mtime = entry.stat().st_mtime
+            if entry.name.startswith(TEMP_PREFIX):
+                # 正在写的临时文件很新，只删除超过 temp_age 的残留
+                if now - mtime > self.temp_age:
+                    removed.append(entry.path)
+            elif self.max_age is not None and now - mtime > self.max_age:
+                removed.append(entry.path)
+            else:
+                files.append((mtime, entry.path))
+        if self.max_files is not None and len(files) > self.max_files:
+            files.sort()
+            removed += [p for _, p in files[:len(files) - self.max_files]]
+        for p in removed:
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+        return removed
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
+
+
+_lock = threading.Lock()
+_writer = None
+
+
+def get_writer():
+    """进程内共享的输出写出服务（首次使用时按环境变量创建）"""
+    global _writer
+    with _lock:
+        if _writer is None:
+            _writer = OutputWriter.from_env()
+        return _writer
+
+
+def set_writer(writer):
+    """替换共享的写出服务（如修改输出目录或保留策略），返回旧的服务"""
+    global _writer
+    with _lock:
+        previous, _writer = _writer, writer
+    return previous
+
+
+def write_output(array, path, product='image', fmt=None, bgr=False, params=None, remove=()):
+    """用共享服务提交写出任务，返回 (path, future)"""
+    return get_writer().submit(array, path, product, fmt=fmt, bgr=bgr, params=params, remove=remove)
+
+
+def wait_outputs(path=None, timeout=None):
+    """等待共享服务的写出任务完成（读取其他工具的输出之前调用）"""
+    with _lock:
+        writer = _writer
+    return writer.wait(path, timeout) if writer is not None else True
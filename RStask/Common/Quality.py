@@ -0,0 +1,130 @@
+import math
+import torch
+import torch.nn.functional as F
+
+# 每档质量对应的输入分辨率、测试时增强（翻转 / 多尺度）和切片重叠
+QUALITY_LEVELS = {
+    'fast': {'input_scale': 0.5, 'scales': (1.0,), 'flips': (), 'tile_overlap': 0},
+    'balanced': {'input_scale': 1.0, 'scales': (1.0,), 'flips': (), 'tile_overlap': 0},
+    'accurate': {'input_scale': 1.0, 'scales': (0.75, 1.0, 1.25), 'flips': ('h', 'v'), 'tile_overlap': 64},
+}
+DEFAULT_QUALITY = 'balanced'
+
+
+def get_quality(level=None):
+    """返回质量档位配置，level 为空时使用默认档位"""
+    level = (level or DEFAULT_QUALITY).strip().lower()
+    if level not in QUALITY_LEVELS:
+        raise ValueError(f"Unknown quality level: {level}, expected one of {list(QUALITY_LEVELS)}")
+    return dict(QUALITY_LEVELS[level], name=level)
+
+
+def is_identity(preset):
+    """该档位是否等价于单次原分辨率推理"""
+    return preset['input_scale'] == 1.0 and tuple(preset['scales']) == (1.0,) and not preset['flips']
+
+
+def _flip(x, flip):
+    if flip == 'h':
+        return x.flip(-1)
+    if flip == 'v':
+        return x.flip(-2)
+    return x
+
+
+def _views(preset):
+    """枚举 (尺度, 翻转) 视图；翻转只作用于原尺度"""
+    views = []
+    for s in preset['scales']:
+        views.append((s * preset['input_scale'], None))
+        if s == 1.0:
+            views.extend((s * preset['input_scale'], f) for f in preset['flips'])
+    return views
+
+
+def detection_views(preset):
+    """
+    检测模型（YOLOv5）的增强视图：(尺度, 翻转维度)，翻转维度对应 NCHW 张量（'h' 为 3，'v' 为 2）；
+    input_scale 由 scale_input 单独处理，不计入视图尺度
+    """
+    return [(s, {'h': 3, 'v': 2}.get(f)) for s, f in _views(dict(preset, input_scale=1.0))]
+
+
+def scale_input(batch, input_scale, multiple=32):
+    """
+    按档位的 input_scale 缩放输入，尺寸对齐到 multiple
+
+    Returns:
+        batch: 缩放后的 [B, C, h, w]
+        ratio: (h / H, w / W)，检测框除以该比例即回到原图坐标
+    """
+    if input_scale == 1.0:
+        return batch, (1.0, 1.0)
+    h, w = batch.shape[-2:]
+    sh = max(int(round(h * input_scale / multiple)) * multiple, multiple)
+    sw = max(int(round(w * input_scale / multiple)) * multiple, multiple)
+    return F.interpolate(batch, size=(sh, sw), mode='bilinear', align_corners=False), (sh / h, sw / w)
+
+
+def tta_dense(model_fn, batch, preset, out_size=None, multiple=32):
+    """密集预测（分割）的测试时增强，所有视图填充到同一尺寸后合并成一个大 batch 推理
+
+    Args:
+        model_fn: 输入 [N, C, H, W]、输出 [N, K, h, w] logits 的函数
+        batch: 归一化后的输入 [B, C, H, W]
+        preset: get_quality 返回的档位配置
+        out_size: 输出概率图尺寸，默认为输入尺寸
+        multiple: 填充后的尺寸对齐到该倍数
+
+    Returns:
+        probs: [B, K, out_h, out_w] 各视图 softmax 概率的平均
+    """
+    b, _, h, w = batch.shape
+    out_size = out_size or (h, w)
+    views = _views(preset)
+    sizes = [(max(int(round(h * s)), 1), max(int(round(w * s)), 1)) for s, _ in views]
+    ph = int(math.ceil(max(sh for sh, _ in sizes) / multiple) * multiple)
+    pw = int(math.ceil(max(sw for _, sw in sizes) / multiple) * multiple)
+
+    inputs = []
+    for (s, flip), (sh, sw) in zip(views, sizes):
+        x = batch if (sh, sw) == (h, w) else F.interpolate(batch, size=(sh, sw), mode='bilinear', align_corners=False)
+        inputs.append(F.pad(_flip(x, flip), [0, pw - sw, 0, ph - sh]))
+    with torch.no_grad():
+        logits = model_fn(torch.cat(inputs, 0))
+
+    oh, ow = logits.shape[-2:]
+    probs = 0
+    for i, ((s, flip), (sh, sw)) in enumerate(zip(views, sizes)):
+        y = logits[i * b:(i + 1) * b, :, :int(round(sh * oh / ph)), :int(round(sw * ow / pw))]
+        y = F.interpolate(_flip(y, flip), size=tuple(out_size), mode='bilinear', align_corners=False)
+        probs = probs + torch.softmax(y, 1)
+    return probs / len(views)
+
+
+def tta_classify(model_fn, batch, preset):
+    """分类的测试时增强：同一尺度的翻转视图合并为一个 batch，各视图 softmax 概率取平均
+
+    全局池化对填充敏感，因此不同尺度分别推理。
+
+    Args:
+        model_fn: 输入 [N, C, H, W]、输出 [N, K] logits 的函数
+        batch: 归一化后的输入 [B, C, H, W]
+        preset: get_quality 返回的档位配置
+
+    Returns:
+        probs: [B, K]
+    """
+    b, _, h, w = batch.shape
+    groups = {}
+    for s, flip in _views(preset):
+        groups.setdefault(s, []).append(flip)
+    probs, count = 0, 0
+    with torch.no_grad():
+        for s, flips in groups.items():
+            x = batch if s == 1.0 else F.interpolate(
+                batch, size=(max(int(round(h * s)), 1), max(int(round(w * s)), 1)), mode='bilinear', align_corners=False)
+            logits = model_fn(torch.cat([_flip(x, f) for f in flips], 0))
+            probs = probs + torch.softmax(logits, 1).reshape(len(flips), b, -1).sum(0)
+            count += len(flips)
+    return probs / count
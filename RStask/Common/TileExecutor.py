@@ -0,0 +1,126 @@
+import os
+import numpy as np
+from PIL import Image
+from RStask.Common.OutputWriter import temp_path, write_output, wait_outputs
+
+# 超过该尺寸（最长边）的影像按切片执行
+DEFAULT_TILE_SIZE = 2048
+
+
+def open_raster(path, mode=None):
+    """
+    读取输入影像：.npy 以内存映射方式打开，按需读取切片；其余格式（PNG / JPEG 等）只能整体解码一次
+
+    Args:
+        path: 影像路径
+        mode: 可选的 PIL 模式（如 'RGB'），非 .npy 输入按该模式转换
+    """
+    # 输入可能是其他工具仍在后台写出的结果
+    wait_outputs(path)
+    if path.lower().endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    image = Image.open(path)
+    if mode is not None and image.mode != mode:
+        image = image.convert(mode)
+    return np.asarray(image)
+
+
+def scale_alignment(scale, max_align=64):
+    """最小的整数 k 使 k * scale 为整数，切片起点按 k 对齐后输出坐标没有亚像素偏移"""
+    for k in range(1, max_align + 1):
+        if abs(k * scale - round(k * scale)) < 1e-6:
+            return k
+    return 1
+
+
+class TileExecutor:
+    """
+    带 halo 的切片执行器
+
+    按行优先顺序把影像切成互不重叠的核心窗口，每个窗口向外扩展 halo 像素（不超出影像边界）后交给处理函数，
+    只把核心区域写入磁盘上的内存映射输出。halo 应不小于滤波器的感受野半径，
+    这样核心区域的结果与整幅处理一致；影像边界处不扩展，边界填充方式与整幅处理相同。
+    峰值内存只与切片大小有关。
+    """
+    def __init__(self, tile_size=DEFAULT_TILE_SIZE, halo=0, scale=1):
+        self.scale = scale
+        align = scale_alignment(scale)
+        self.tile_size = max(int(np.ceil(tile_size / align)) * align, align)
+        self.halo = int(np.ceil(halo / align)) * align
+
+    def needs_tiling(self, shape):
+        return max(shape[:2]) > self.tile_size
+
+    def windows(self, h, w):
+        """
+        切片窗口（输入坐标），行优先顺序
+
+        Returns:
+            windows: [((y0, y1, x0, x1), (ty0, ty1, tx0, tx1)), ...]，前者为核心区域，后者为带 halo 的读取范围
+        """
+        windows = []
+        for y0 in range(0, h, self.tile_size):
+            y1 = min(y0 + self.tile_size, h)
+            ty0, ty1 = max(y0 - self.halo, 0), min(y1 + self.halo, h)
+            for x0 in range(0, w, self.tile_size):
+                x1 = min(x0 + self.tile_size, w)
+                tx0, tx1 = max(x0 - self.halo, 0), min(x1 + self.halo, w)
+                windows.append(((y0, y1, x0, x1), (ty0, ty1, tx0, tx1)))
+        return windows
+
+    def run(self, image, fn, out_path=None, to_bgr=False):
+        """
+        Args:
+            image: [H, W] 或 [H, W, C] 数组（可为内存映射）
+            fn: 处理函数 fn(tile, out_size)，tile 为带 halo 的输入窗口，
+                out_size 为该窗口对应的输出尺寸 (h, w)（scale != 1 时用于缩放类工具）
+            out_path: 可选，输出 .npy 路径（内存映射写入）；为空时输出保存在内存中
+            to_bgr: 写入时把 3 通道结果从 RGB 转为 BGR，便于 cv2 直接编码
+
+        Returns:
+            output: 输出数组（给定 out_path 时为内存映射）
+        """
+        h, w = image.shape[:2]
+        s = self.scale
+        out_h, out_w = int(h * s), int(w * s)
+
+        def out_coord(v, length, out_length):
+            return out_length if v >= length else int(round(v * s))
+
+        output = None
+        for (y0, y1, x0, x1), (ty0, ty1, tx0, tx1) in self.windows(h, w):
+            oy0, oy1 = out_coord(ty0, h, out_h), out_coord(ty1, h, out_h)
+            ox0, ox1 = out_coord(tx0, w, out_w), out_coord(tx1, w, out_w)
+            result = fn(np.ascontiguousarray(image[ty0:ty1, tx0:tx1]), (oy1 - oy0, ox1 - ox0))
+            if to_bgr and result.ndim == 3 and result.shape[2] == 3:
+                result = result[:, :, ::-1]
+            if output is None:
+                shape = (out_h, out_w) + result.shape[2:]
+                if out_path is None:
+                    output = np.empty(shape, dtype=result.dtype)
+                else:
+                    output = np.lib.format.open_memmap(out_path, mode='w+', dtype=result.dtype, shape=shape)
+            cy0, cy1 = out_coord(y0, h, out_h), out_coord(y1, h, out_h)
+            cx0, cx1 = out_coord(x0, w, out_w), out_coord(x1, w, out_w)
+            output[cy0:cy1, cx0:cx1] = result[cy0 - oy0:cy1 - oy0, cx0 - ox0:cx1 - ox0]
+        if isinstance(output, np.memmap):
+            output.flush()
+        return output
+
+    def write(self, image, fn, path, params=None):
+        """
+        切片执行并把结果写到 path：.npy 直接以内存映射写出，其余格式先写入同目录的临时内存映射，
+        再交给共享的输出写出服务在后台编码（编码时只有 cv2 读取页缓存，不会在内存中再复制一份完整输出），
+        编码完成后删除临时文件；需要读取结果时先调用 wait_outputs(path)
+        """
+        if path.lower().endswith('.npy'):
+            self.run(image, fn, out_path=path)
+            return path
+        tmp_path = temp_path(os.path.dirname(os.path.abspath(path)), '.npy')
+        try:
+            output = self.run(image, fn, out_path=tmp_path, to_bgr=True)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return write_output(output, path, bgr=True, params=params, remove=[tmp_path])[0]
@@ -0,0 +1,39 @@
+def tile_starts(length, tile, stride):
+    """计算一维方向上的窗口起点，最后一个窗口贴齐边界"""
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+
+def iter_tiles(h, w, tile, overlap=0):
+    """按行优先顺序生成窗口 (y, x, th, tw)
+
+    Args:
+        h, w: 图像高宽
+        tile: 窗口边长
+        overlap: 相邻窗口的重叠像素数
+    """
+    stride = max(tile - overlap, 1)
+    for y in tile_starts(h, tile, stride):
+        for x in tile_starts(w, tile, stride):
+            yield y, x, min(tile, h), min(tile, w)
+
+
+def tile_grid(h, w, tile, overlap=0):
+    """返回窗口网格的行列起点 (ys, xs)"""
+    stride = max(tile - overlap, 1)
+    return tile_starts(h, tile, stride), tile_starts(w, tile, stride)
+
+
+def batched(iterable, batch_size):
+    """把可迭代对象切分为长度不超过 batch_size 的列表"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
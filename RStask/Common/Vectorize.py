@@ -0,0 +1,183 @@
+import json
+import cv2
+import numpy as np
+
+
+def class_statistics(label_map, class_names):
+    """按类别统计像素数量与面积占比
+
+    Args:
+        label_map: [H, W] 整型类别图
+        class_names: 类别名称列表，下标即类别编号
+
+    Returns:
+        stats: 每个类别一个 dict，包含 index / name / pixels / fraction
+    """
+    num_classes = len(class_names)
+    counts = np.bincount(label_map.ravel().astype(np.int64), minlength=num_classes)[:num_classes]
+    total = max(int(label_map.size), 1)
+    return [{'index': i, 'name': class_names[i], 'pixels': int(counts[i]), 'fraction': counts[i] / total}
+            for i in range(num_classes)]
+
+
+def extract_instances(mask, min_area=0, prob=None):
+    """对二值掩膜做连通域标记，提取实例
+
+    Args:
+        mask: [H, W] 二值掩膜
+        min_area: 最小实例面积（像素），更小的连通域被丢弃
+        prob: 可选的 [H, W] 概率图，用于计算每个实例的平均置信度
+
+    Returns:
+        labels: [H, W] 连通域标记图（0 为背景，已丢弃的实例也置 0）
+        instances: 每个实例一个 dict，包含 id / area / bbox(x, y, w, h) / centroid(x, y) / score
+    """
+    num, labels, stats, centroids = cv2.connectedComponentsWithStats(
+        (mask > 0).astype(np.uint8), connectivity=8)
+    areas = stats[:, cv2.CC_STAT_AREA]
+    keep = np.flatnonzero(areas >= max(min_area, 1))
+    keep = keep[keep > 0]
+    if len(keep) < num - 1:
+        # 一次查表把丢弃的连通域清零
+        lut = np.zeros(num, dtype=labels.dtype)
+        lut[keep] = keep
+        labels = lut[labels]
+
+    scores = None
+    if prob is not None:
+        sums = np.bincount(labels.ravel(), weights=prob.ravel().astype(np.float64), minlength=num)
+        scores = sums / np.maximum(areas, 1)
+
+    instances = []
+    for i in keep:
+        x, y, w, h = stats[i, :4]
+        instance = {'id': int(i), 'area': int(areas[i]), 'bbox': [int(x), int(y), int(w), int(h)],
+                    'centroid': [float(centroids[i, 0]), float(centroids[i, 1])]}
+        if scores is not None:
+            instance['score'] = float(scores[i])
+        instances.append(instance)
+    return labels, instances
+
+
+def polygonize(mask, epsilon=1.0, min_area=0):
+    """将二值掩膜转换为简化多边形（外环 + 内洞）
+
+    Args:
+        mask: [H, W] 二值掩膜
+        epsilon: Douglas-Peucker 简化容差（像素）
+        min_area: 外环最小面积（像素）
+
+    Returns:
+        polygons: 多边形列表，每个多边形为若干闭合环 [[x, y], ...]，第一个为外环
+    """
+    contours, hierarchy = cv2.findContours((mask > 0).astype(np.uint8), cv2.RETR_CCOMP,
+                                           cv2.CHAIN_APPROX_SIMPLE)
+    if hierarchy is None:
+        return []
+    hierarchy = hierarchy[0]
+
+    def to_ring(contour):
+        if epsilon > 0:
+            contour = cv2.approxPolyDP(contour, epsilon, True)
+        ring = contour.reshape(-1, 2).tolist()
+        if len(ring) < 3:
+            return None
+        return ring + [ring[0]]
+
+    polygons = []
+    for i, contour in enumerate(contours):
+        # RETR_CCOMP: 父节点为 -1 的是外环，其子节点为内洞
+        if hierarchy[i][3] != -1 or cv2.contourArea(contour) < min_area:
+            continue
+        outer = to_ring(contour)
+        if outer is None:
+            continue
+        rings = [outer]
+        child = hierarchy[i][2]
+        while child != -1:
+            hole = to_ring(contours[child])
+            if hole is not None:
+                rings.append(hole)
+            child = hierarchy[child][0]
+        polygons.append(rings)
+    return polygons
+
+
+def apply_geotransform(rings, geotransform):
+    """按 GDAL 六参数仿射变换把像素坐标转换为地理坐标"""
+    x0, dx, rx, y0, ry, dy = geotransform
+    return [[[x0 + px * dx + py * rx, y0 + px * ry + py * dy] for px, py in ring] for ring in rings]
+
+
+def write_geojson(features, path, geotransform=None):
+    """导出 GeoJSON
+
+    Args:
+        features: (polygon, properties) 列表，polygon 为 polygonize 的单个输出
+        path: 输出文件路径
+        geotransform: 可选的 GDAL 仿射参数；为空时坐标为像素坐标
+    """
+    collection = {'type': 'FeatureCollection', 'features': []}
+    for rings, properties in features:
+        if geotransform is not None:
+            rings = apply_geotransform(rings, geotransform)
+        collection['features'].append({'type': 'Feature', 'properties': properties,
+                                       'geometry': {'type': 'Polygon', 'coordinates': rings}})
+    with open(path, 'w') as f:
+        json.dump(collection, f)
+    return path
+
+
+def summarize_label_map(label_map, class_names, geojson_path=None, classes=None, min_area=16,
+                        epsilon=1.0, ignore=(), top_k=3, prob=None):
+    """统计类别图并（可选）导出 GeoJSON，返回给 agent 的文本摘要
+
+    Args:
+        label_map: [H, W] 整型类别图
+        class_names: 类别名称列表
+        geojson_path: GeoJSON 输出路径，为空时不导出
+        classes: 需要提取实例与多边形的类别编号，默认为除 ignore 外的全部类别
+        min_area: 实例 / 多边形的最小面积（像素）
+        epsilon: 多边形简化容差（像素）
+        ignore: 不参与实例提取的类别编号（如背景）
+        top_k: 每个类别在摘要中列出的最大实例数
+        prob: 可选的 [H, W] 像素置信度图，用于给出每个实例的平均置信度
+
+    Returns:
+        summary: 文本摘要
+        stats: class_statistics 的结果
+        instances: {类别编号: 实例列表}
+    """
+    stats = class_statistics(label_map, class_names)
+    if classes is None:
+        classes = [s['index'] for s in stats if s['pixels'] > 0 and s['index'] not in ignore]
+
+    features = []
+    instances = {}
+    for idx in classes:
+        mask = label_map == idx
+        if not mask.any():
+            instances[idx] = []
+            continue
+        _, instances[idx] = extract_instances(mask, min_area=min_area, prob=prob)
+        if geojson_path is not None:
+            for rings in polygonize(mask, epsilon=epsilon, min_area=min_area):
+                features.append((rings, {'class': class_names[idx],
+                                         'area': float(cv2.contourArea(np.array(rings[0], dtype=np.float32)))}))
+
+    parts = []
+    for idx in classes:
+        s = stats[idx]
+        text = f"{s['name']}: {s['fraction'] * 100:.2f}% ({s['pixels']} pixels"
+        insts = sorted(instances[idx], key=lambda k: k['area'], reverse=True)
+        text += f", {len(insts)} regions"
+        if insts:
+            text += ', largest bbox(x,y,w,h): ' + '; '.join(
+                str(i['bbox']) + (f" score {i['score']:.2f}" if 'score' in i else '') for i in insts[:top_k])
+        parts.append(text + ')')
+    summary = 'Area statistics: ' + ('; '.join(parts) if parts else 'no target pixels') + '.'
+
+    if geojson_path is not None:
+        write_geojson(features, geojson_path)
+        summary += f' Polygons exported to {geojson_path}.'
+    return summary, stats, instances
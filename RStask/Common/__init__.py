@@ -0,0 +1 @@
+# Common utilities shared by RS tools
@@ -0,0 +1,80 @@
+"""
+CPU 工具并发吞吐基准：1 到 N 个并发请求下，对比默认线程设置与 CPUPolicy 调优后的吞吐量
+
+用法:
+    python -m RStask.Common.cpu_benchmark --max-concurrency 8 --requests 16 --size 1024 [--umat]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from RStask.Common.CPUPolicy import CPUPolicy, available_cpus
+
+
+def make_workloads(size):
+    """每个请求依次运行的 CPU 工具（不使用缓存，输入为同一幅合成图像）"""
+    from RStask.Common.Contours import detect_edges, find_contours
+    from RStask.Denoising.NonLocalMeans import nl_means
+    from RStask.SuperResolution.Backends import create_backend
+    from RStask.SuperResolution.benchmark import synthetic_image
+
+    image = synthetic_image(size)
+    small = np.ascontiguousarray(image[:size // 2, :size // 2])
+    bicubic, espcn = create_backend('bicubic'), create_backend('espcn')
+    espcn.upscale(small, 2)  # 预先构建模型
+    return {
+        'canny': lambda: detect_edges(image, 100, 200, use_cache=False),
+        'contours': lambda: find_contours(image, use_cache=False),
+        'bicubic_x2': lambda: bicubic.upscale(image, 2),
+        'nlm': lambda: nl_means(small, 10, 7, 21),
+        'espcn_x2': lambda: espcn.upscale(small, 2),
+    }
+
+
+def throughput(workloads, concurrency, requests):
+    """以 concurrency 个线程并发执行 requests 个请求，返回每秒请求数"""
+    def request():
+        for fn in workloads.values():
+            fn()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(request) for _ in range(requests)]:
+            future.result()
+    return requests / (time.perf_counter() - start)
+
+
+def reset_defaults():
+    """恢复 OpenCV / PyTorch 的默认线程设置（各自占满全部核）"""
+    import torch
+    cv2.setNumThreads(-1)
+    torch.set_num_threads(available_cpus())
+
+
+def run(max_concurrency, requests, size, use_umat=False):
+    workloads = make_workloads(size)
+    rows = []
+    levels = sorted(set([2 ** i for i in range(max_concurrency.bit_length()) if 2 ** i <= max_concurrency] +
+                        [max_concurrency]))
+    for concurrency in levels:
+        reset_defaults()
+        default = throughput(workloads, concurrency, requests)
+        policy = CPUPolicy(concurrency=concurrency, use_umat=use_umat).apply()
+        tuned = throughput(workloads, concurrency, requests)
+        rows.append({'concurrency': concurrency, 'default_rps': default, 'tuned_rps': tuned,
+                     'threads': policy.cv2_threads})
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-concurrency', type=int, default=available_cpus())
+    parser.add_argument('--requests', type=int, default=8)
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--umat', action='store_true')
+    args = parser.parse_args()
+    print(f"CPUs: {available_cpus()}")
+    print(f"{'concurrency':>12}{'threads/req':>13}{'default(req/s)':>16}{'tuned(req/s)':>14}")
+    for row in run(args.max_concurrency, args.requests, args.size, args.umat):
+        print(f"{row['concurrency']:>12}{row['threads']:>13}{row['default_rps']:>16.2f}{row['tuned_rps']:>14.2f}")
@@ -1,6 +1,42 @@
-from PIL import Image
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import cv2
 import numpy as np
+from RStask.Common.TileExecutor import TileExecutor, DEFAULT_TILE_SIZE, open_raster
+from RStask.Common.OutputWriter import write_output, temp_path
+from RStask.Common.CPUPolicy import available_cpus, get_policy, init_worker, to_device, to_array
+
+
+def nl_means(img, h, template_window_size, search_window_size):
+    """按通道数选择灰度 / 彩色非局部均值去噪"""
+    if len(img.shape) == 2:
+        # 灰度图去噪
+        result = cv2.fastNlMeansDenoising(to_device(img), None, h=h, templateWindowSize=template_window_size,
+                                          searchWindowSize=search_window_size)
+    else:
+        # 彩色图去噪
+        result = cv2.fastNlMeansDenoisingColored(to_device(img), None, h=h, hColor=h,
+                                                 templateWindowSize=template_window_size,
+                                                 searchWindowSize=search_window_size)
+    return to_array(result)
+
+
+def _denoise_window(src_path, dst_path, core, padded, params, bgr):
+    """
+    进程池任务：以内存映射打开输入 / 输出 .npy，对带 halo 的窗口去噪后只把核心区域写入输出文件，
+    任务参数中只有路径与坐标，不传递像素数组；bgr=True 时 3 通道结果按 BGR 写出，便于 cv2 直接编码
+    """
+    src = np.load(src_path, mmap_mode='r')
+    dst = np.load(dst_path, mmap_mode='r+')
+    y0, y1, x0, x1 = core
+    ty0, ty1, tx0, tx1 = padded
+    result = nl_means(np.ascontiguousarray(src[ty0:ty1, tx0:tx1]), *params)
+    result = result[y0 - ty0:y1 - ty0, x0 - tx0:x1 - tx0]
+    dst[y0:y1, x0:x1] = result[:, :, ::-1] if bgr and result.ndim == 3 else result
+    dst.flush()
+    del src, dst
 
 class NonLocalMeansDenoising:
     """基于非局部均值的去噪算法"""
@@ -9,41 +45,124 @@ class NonLocalMeansDenoising:
         self.h = 10  # 滤波强度，值越大去噪效果越强但会损失更多细节
         self.template_window_size = 7  # 模板窗口大小
         self.search_window_size = 21   # 搜索窗口大小
-        
-    def inference(self, inputs, new_image_name):
+        self.tile_size = DEFAULT_TILE_SIZE
+        self.num_workers = available_cpus()  # 并行去噪的进程数，1 表示不使用进程池
+        self.parallel_tile_size = 512  # 并行去噪的切片大小
+        # 进程池在首次并行去噪时创建，之后的请求复用
+        self.pool = None
+        self.pool_workers = 0
+        self.pool_lock = threading.Lock()
+
+    @property
+    def tile_halo(self):
+        # 每个像素用到搜索窗口内各点的模板块
+        return self.search_window_size // 2 + self.template_window_size // 2
+
+    def process(self, img):
+        """对内存中的 [H, W] 或 [H, W, 3] uint8 图像去噪"""
+        return nl_means(img, self.h, self.template_window_size, self.search_window_size)
+
+    def get_pool(self, num_workers):
+        """复用进程池，进程数变化时重建；worker 内 OpenCV / torch 单线程，并行度由进程数提供"""
+        with self.pool_lock:
+            if self.pool is None or self.pool_workers != num_workers:
+                if self.pool is not None:
+                    self.pool.shutdown()
+                self.pool = ProcessPoolExecutor(max_workers=num_workers, initializer=init_worker,
+                                                initargs=(get_policy().worker(),))
+                self.pool_workers = num_workers
+            return self.pool
+
+    def close(self):
+        """关闭进程池"""
+        with self.pool_lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+
+    def process_parallel(self, src_path, dst_path, num_workers=None, tile_size=None, bgr=False):
+        """
+        多进程并行去噪：输入与输出均为 .npy 内存映射文件，按带 halo 的切片分发给进程池，
+        各进程把核心区域直接写入输出文件，主进程和各 worker 都不持有完整的输入或输出；
+        halo 覆盖了搜索窗口与模板窗口，拼接结果与整幅去噪一致
+
+        Args:
+            src_path: 输入 .npy 路径（[H, W] 或 [H, W, 3] uint8）
+            dst_path: 输出 .npy 路径（在此创建）
+            num_workers: 进程数，默认为 self.num_workers
+            tile_size: 切片大小，默认为 self.parallel_tile_size
+            bgr: 3 通道结果是否按 BGR 写出
+
+        Returns:
+            result: 输出的内存映射数组
+        """
+        src = np.load(src_path, mmap_mode='r')
+        shape, dtype = src.shape, src.dtype
+        del src
+        executor = TileExecutor(tile_size or self.parallel_tile_size, halo=self.tile_halo)
+        windows = executor.windows(*shape[:2])
+        params = (self.h, self.template_window_size, self.search_window_size)
+        np.lib.format.open_memmap(dst_path, mode='w+', dtype=dtype, shape=shape).flush()
+        pool = self.get_pool(num_workers or self.num_workers)
+        try:
+            futures = [pool.submit(_denoise_window, src_path, dst_path, core, padded, params, bgr)
+                       for core, padded in windows]
+            for future in futures:
+                future.result()
+        except BrokenProcessPool:
+            # worker 异常退出后进程池不可再用，下次请求重建
+            with self.pool_lock:
+                self.pool = None
+            raise
+        return np.load(dst_path, mmap_mode='r')
+
+    def write_parallel(self, inputs, img, new_image_name, num_workers=None, tile_size=None):
+        """
+        并行去噪并写出：.npy 输入直接作为共享输入，其余格式的解码结果先写入输出目录的临时 .npy；
+        输出先写入临时内存映射，再交给输出写出服务编码（.npy 输出直接写到目标路径）
+        """
+        directory = os.path.dirname(os.path.abspath(new_image_name))
+        if isinstance(img, np.memmap):
+            src_path, src_temp = inputs, False
+        else:
+            src_path, src_temp = temp_path(directory, '.npy'), True
+            np.save(src_path, img)
+        try:
+            if new_image_name.lower().endswith('.npy'):
+                self.process_parallel(src_path, new_image_name, num_workers, tile_size)
+                return new_image_name
+            dst_path = temp_path(directory, '.npy')
+            try:
+                output = self.process_parallel(src_path, dst_path, num_workers, tile_size, bgr=True)
+            except BaseException:
+                if os.path.exists(dst_path):
+                    os.remove(dst_path)
+                raise
+            return write_output(output, new_image_name, bgr=True, remove=[dst_path])[0]
+        finally:
+            if src_temp:
+                os.remove(src_path)
+
+    def inference(self, inputs, new_image_name, tile_size=None, num_workers=None):
         """执行图像去噪
         
         Args:
-            inputs: 输入图像路径
+            inputs: 输入图像路径（.npy 以内存映射读取）
             new_image_name: 输出图像路径
+            tile_size: 切片大小；并行时默认为 self.parallel_tile_size，
+                串行时默认为 self.tile_size（最长边超过该值时按切片流式执行）
+            num_workers: 进程数，默认为 self.num_workers；大于 1 且图像大于一个切片时并行去噪
         """
-        image = Image.open(inputs)
-        img = np.array(image)
-        
-        # 判断是灰度图还是彩色图
-        if len(img.shape) == 2:
-            # 灰度图去噪
-            result = cv2.fastNlMeansDenoising(
-                img, 
-                None, 
-                h=self.h,
-                templateWindowSize=self.template_window_size,
-                searchWindowSize=self.search_window_size
-            )
+        img = open_raster(inputs)
+        num_workers = num_workers or self.num_workers
+        executor = TileExecutor(tile_size or self.tile_size, halo=self.tile_halo)
+        if num_workers > 1 and max(img.shape[:2]) > (tile_size or self.parallel_tile_size):
+            self.write_parallel(inputs, img, new_image_name, num_workers, tile_size)
+        elif executor.needs_tiling(img.shape):
+            executor.write(img, lambda tile, size: self.process(tile), new_image_name)
         else:
-            # 彩色图去噪
-            result = cv2.fastNlMeansDenoisingColored(
-                img,
-                None,
-                h=self.h,
-                hColor=self.h,
-                templateWindowSize=self.template_window_size,
-                searchWindowSize=self.search_window_size
-            )
-        
-        # 保存结果
-        result_image = Image.fromarray(result)
-        result_image.save(new_image_name)
+            # 保存结果（后台编码）
+            write_output(self.process(np.ascontiguousarray(img)), new_image_name)
         
         print(f"\nProcessed Denoising, Input Image: {inputs}, Output Image: {new_image_name}")
         return None
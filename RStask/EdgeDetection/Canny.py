@@ -1,20 +1,107 @@
-from PIL import Image
 import cv2
 import numpy as np
+from RStask.Common.TileExecutor import TileExecutor, DEFAULT_TILE_SIZE, open_raster
+from RStask.Common.Contours import detect_edges, multiscale_edges, auto_thresholds, gray_histogram, to_uint8
+from RStask.Common.OutputWriter import write_output
+
+# 输出格式：gray 为单通道 8 位 PNG，bit 为 1 位 PNG（按位打包），rgb 为旧版三通道 PNG
+OUTPUT_MODES = ('gray', 'bit', 'rgb')
+
+
 class Image2Canny:
     def __init__(self):
         print("Initializing Image2Canny")
         self.low_threshold = 100
         self.high_threshold = 200
+        self.threshold_mode = 'fixed'  # fixed / median / otsu
+        self.sigma = 0.33  # median 模式的阈值相对宽度
+        self.levels = 1  # 金字塔层数，大于 1 时为多尺度模式
+        self.output_mode = 'gray'
+        self.tile_size = DEFAULT_TILE_SIZE
+        # Sobel + 非极大值抑制只依赖 3x3 邻域；滞后阈值的边缘连接是全局的，halo 留出足够的连接余量
+        self.tile_halo = 16
+
+    def thresholds(self, image, mode=None):
+        """
+        确定 Canny 阈值：fixed 使用 (low_threshold, high_threshold)，median / otsu 由整幅图像的灰度直方图计算一次
+
+        Args:
+            image: uint8 图像（可为内存映射）
+            mode: 阈值模式或 (low, high) 元组，默认为 self.threshold_mode
+        """
+        mode = mode or self.threshold_mode
+        if isinstance(mode, (tuple, list)):
+            return int(mode[0]), int(mode[1])
+        if mode == 'fixed':
+            return self.low_threshold, self.high_threshold
+        return auto_thresholds(mode=mode, sigma=self.sigma, hist=gray_histogram(image))
+
+    def process(self, image, use_cache=True, thresholds=None, levels=None):
+        """
+        对内存中的图像做 Canny 边缘检测（与轮廓工具共享缓存）
 
-    def inference(self, inputs,new_image_name):
-        image = Image.open(inputs)
-        image = np.array(image)
-        canny = cv2.Canny(image, self.low_threshold, self.high_threshold)
+        Args:
+            image: [H, W] 或 [H, W, C] 图像，非 uint8 时先拉伸到 uint8
+            use_cache: 是否使用共享缓存
+            thresholds: (low, high)，默认按 self.threshold_mode 计算
+            levels: 金字塔层数，默认为 self.levels
+
+        Returns:
+            edges: [H, W] uint8 边缘图
+        """
+        image = to_uint8(image)
+        low, high = thresholds or self.thresholds(image)
+        levels = levels or self.levels
+        if levels > 1:
+            return multiscale_edges(image, low, high, levels=levels, use_cache=use_cache)
+        return detect_edges(image, low, high, use_cache=use_cache)
+
+    def to_rgb(self, canny):
         canny = canny[:, :, None]
-        canny = np.concatenate([canny, canny, canny], axis=2)
-        canny = Image.fromarray(canny)
+        return np.concatenate([canny, canny, canny], axis=2)
+
+    def encode(self, canny, output_mode):
+        """按输出格式转换边缘图"""
+        return self.to_rgb(canny) if output_mode == 'rgb' else canny
+
+    def save(self, canny, path, output_mode):
+        """提交后台写出：gray / bit 作为标签栅格原样写出（bit 为按位打包的 1 位 PNG），rgb 作为普通图像"""
+        if output_mode == 'bit':
+            return write_output(canny, path, product='label', params=[cv2.IMWRITE_PNG_BILEVEL, 1])
+        if output_mode == 'gray':
+            return write_output(canny, path, product='label')
+        return write_output(self.encode(canny, output_mode), path)
+
+    def inference(self, inputs, new_image_name, tile_size=None, thresholds=None, levels=None, output=None):
+        """
+        Args:
+            inputs: 输入图像路径（.npy 以内存映射读取）
+            new_image_name: 输出图像路径
+            tile_size: 切片大小，最长边超过该值时按切片执行，默认为 self.tile_size
+            thresholds: 阈值模式 fixed / median / otsu 或 (low, high)，默认为 self.threshold_mode
+            levels: 金字塔层数，大于 1 时为多尺度模式，默认为 self.levels
+            output: 输出格式 gray / bit / rgb，默认为 self.output_mode
+        """
+        output = output or self.output_mode
+        if output not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode {output!r}, expected one of {OUTPUT_MODES}")
+        levels = levels or self.levels
+        image = open_raster(inputs)
+        # 阈值在整幅图像上统计一次，所有切片共用
+        if image.dtype != np.uint8:
+            image = to_uint8(image)
+        low, high = self.thresholds(image, thresholds)
+        # 多尺度模式下最粗一层的感受野按 2 的层数次幂放大
+        executor = TileExecutor(tile_size or self.tile_size, halo=self.tile_halo * 2 ** (levels - 1))
         updated_image_path = new_image_name
-        canny.save(updated_image_path)
-        print(f"\nProcessed Image2Canny, Input Image: {inputs}, Output Text: {updated_image_path}")
+        if executor.needs_tiling(image.shape):
+            params = [cv2.IMWRITE_PNG_BILEVEL, 1] if output == 'bit' else None
+            executor.write(image, lambda tile, size: self.encode(
+                self.process(tile, use_cache=False, thresholds=(low, high), levels=levels), output),
+                updated_image_path, params=params)
+        else:
+            canny = self.process(np.ascontiguousarray(image), thresholds=(low, high), levels=levels)
+            self.save(canny, updated_image_path, output)
+        print(f"\nProcessed Image2Canny, Input Image: {inputs}, Output Text: {updated_image_path}, "
+              f"Thresholds: {low}/{high}")
         return None
\ No newline at end of file
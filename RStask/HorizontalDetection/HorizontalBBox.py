@@ -1,6 +1,8 @@
-from PIL import Image, ImageDraw, ImageFont
-import cv2
+from PIL import Image
 import numpy as np
+from RStask.Common.Contours import find_contours, bounding_boxes
+from RStask.Common.OutputWriter import write_output
+from RStask.Common.Drawing import draw_polygons, draw_labels, boxes_to_polygons, to_rgb_array
 
 class HorizontalBBoxDetection:
     """水平边界框检测算法（基于边缘检测和轮廓提取）"""
@@ -9,64 +11,40 @@ class HorizontalBBoxDetection:
         self.min_area = 100  # 最小检测区域面积
         self.canny_low = 50
         self.canny_high = 150
+        self.max_labels = 200  # 目标数超过该值时不绘制文字标签
         
-    def inference(self, inputs, new_image_name):
+    def inference(self, inputs, new_image_name, labels=None):
         """执行水平边界框检测
         
         Args:
             inputs: 输入图像路径
             new_image_name: 输出图像路径
+            labels: 是否绘制文字标签，默认在目标数不超过 self.max_labels 时绘制
         """
         image = Image.open(inputs)
         img = np.array(image)
         
-        # 转换为灰度图
-        if len(img.shape) == 3:
-            gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-        else:
-            gray = img
+        # 灰度 / 模糊 / Canny / 闭运算 / 查找轮廓，结果在各检测工具间共享缓存
+        found = find_contours(img, self.canny_low, self.canny_high)
         
-        # 高斯模糊
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        # 面积过滤与外接框计算均对全部轮廓批量完成
+        keep = np.flatnonzero(found['areas'] >= self.min_area)
+        boxes = bounding_boxes([found['contours'][i] for i in keep])
+        bbox_count = len(boxes)
         
-        # Canny边缘检测
-        edges = cv2.Canny(blurred, self.canny_low, self.canny_high)
+        # 一次 polylines 绘制全部水平边界框
+        result = draw_polygons(to_rgb_array(image), boxes_to_polygons(boxes), (255, 0, 0))
+        result_img = Image.fromarray(result)
         
-        # 形态学操作，连接边缘
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
-        closed = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel)
+        # 添加标签
+        if labels is None:
+            labels = bbox_count <= self.max_labels
+        if labels:
+            draw_labels(result_img, [f"Object {i + 1}" for i in range(bbox_count)],
+                        [(x, y - 15) for x, y, _, _ in boxes], 'red')
         
-        # 查找轮廓
-        contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        # 在原图上绘制水平边界框
-        result_img = image.copy()
-        draw = ImageDraw.Draw(result_img)
-        
-        bbox_count = 0
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if area < self.min_area:
-                continue
-            
-            # 获取水平边界框
-            x, y, w, h = cv2.boundingRect(contour)
-            
-            # 绘制矩形框
-            draw.rectangle([x, y, x+w, y+h], outline='red', width=2)
-            
-            # 添加标签
-            label = f"Object {bbox_count+1}"
-            try:
-                font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 12)
-            except:
-                font = ImageFont.load_default()
-            draw.text((x, y-15), label, fill='red', font=font)
-            
-            bbox_count += 1
-        
-        # 保存结果
-        result_img.save(new_image_name)
+        # 保存结果（后台编码）
+        write_output(np.asarray(result_img), new_image_name)
         
         print(f"\nProcessed HorizontalDetection, Input Image: {inputs}, Output Image: {new_image_name}, Detected: {bbox_count} objects")
         return None
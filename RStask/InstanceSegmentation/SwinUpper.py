@@ -1,8 +1,11 @@
 from RStask.InstanceSegmentation.model import SwinUPer
 import torch
+import torch.nn.functional as F
 from skimage import io
-from PIL import Image
 import numpy as np
+from RStask.Common.Vectorize import summarize_label_map
+from RStask.Common.Quality import get_quality, is_identity, tta_dense
+from RStask.Common.OutputWriter import write_output
 class SwinInstance:
     def __init__(self, device):
         print("Initializing InstanceSegmentation")
@@ -21,23 +24,61 @@ class SwinInstance:
                          'basketball court': 6, 'ground track field': 7, 'harbor': 8, 'bridge': 9,
                          'large vehicle': 10, 'small vehicle': 11, 'helicopter': 12, 'roundabout': 13,
                          'soccer ball field': 14, 'swimming pool': 15}
-    def inference(self, image_path, det_prompt ,updated_image_path):
-        image = torch.from_numpy(io.imread(image_path))
-        image = (image.permute(2, 0, 1).unsqueeze(0) - self.mean) / self.std
+        # 低分辨率存在性检查：长边缩放到 presence_size，类别通道 softmax 最大值低于阈值即判定不存在
+        self.presence_size = 256
+        self.presence_threshold = 0.3
+
+    def resolve_category(self, det_prompt):
+        """把提示词解析为类别编号，不支持时返回 None"""
+        name = det_prompt.strip().lower().replace('_', ' ')
+        for key, idx in self.all_dict.items():
+            if name == key or name == key + 's':
+                return idx
+        return None
+
+    def presence_score(self, image, idx):
+        """在低分辨率下估计目标类别的最大置信度，图像本身不大于 presence_size 时返回 None"""
+        h, w = image.shape[-2:]
+        scale = self.presence_size / max(h, w)
+        if scale >= 1:
+            return None
+        small = F.interpolate(image, size=(max(int(h * scale) // 32, 1) * 32, max(int(w * scale) // 32, 1) * 32),
+                              mode='bilinear', align_corners=False)
         with torch.no_grad():
-            pred = self.model(image.to(self.device))
-        pred = pred.argmax(1).cpu().squeeze().int().numpy()
+            logits = self.model(small.to(self.device))
+        return torch.softmax(logits, 1)[:, idx].max().item()
 
-        if det_prompt.strip().lower() in [i.strip().lower()  for i in self.all_dict.keys()]:
-            idx=[i.replace(' ', '_').lower() for i in self.all_dict.keys()].index(det_prompt.strip().lower())+1
-            pred=(pred==idx)*255
-            pred = Image.fromarray(np.stack([pred, pred, pred], -1).astype(np.uint8))
-            pred.save(updated_image_path)
-            print(f"\nProcessed Instance Segmentation, Input Image: {image_path + ',' + det_prompt}, Output SegMap: {updated_image_path}")
-            return updated_image_path
-        else:
+    def inference(self, image_path, det_prompt ,updated_image_path, quality=None):
+        idx = self.resolve_category(det_prompt)
+        if idx is None:
             print(f"\nCategory: { det_prompt} is not supported. Please use other tools.")
             return f"Category {det_prompt} is not supported. Please use other tools."
+        preset = get_quality(quality)
+        image = torch.from_numpy(io.imread(image_path))
+        image = (image.permute(2, 0, 1).unsqueeze(0) - self.mean) / self.std
 
+        score = self.presence_score(image, idx)
+        if score is not None and score < self.presence_threshold:
+            print(f"\nProcessed Instance Segmentation, Input Image: {image_path + ',' + det_prompt}, Presence score: {score:.3f}, none found")
+            return f"No {det_prompt.strip()} found in {image_path} (max confidence {score:.2f})."
+
+        with torch.no_grad():
+            if is_identity(preset):
+                probs = torch.softmax(self.model(image.to(self.device)), 1)
+            else:
+                probs = tta_dense(self.model, image.to(self.device), preset, out_size=image.shape[-2:])
+        pred = probs.argmax(1).cpu().squeeze().int().numpy()
+        if not (pred == idx).any():
+            print(f"\nProcessed Instance Segmentation, Input Image: {image_path + ',' + det_prompt}, none found")
+            return f"No {det_prompt.strip()} found in {image_path}."
 
+        # 每个实例的置信度为其像素上类别概率的均值
+        prob = probs[0, idx].cpu().numpy()
+        summary, _, _ = summarize_label_map(pred, ['background'] + list(self.all_dict.keys()),
+                                            geojson_path=updated_image_path[:-4] + '.geojson', classes=[idx], prob=prob)
+        pred=(pred==idx)*255
+        # 0/255 掩膜原样写出，后台编码
+        write_output(np.stack([pred, pred, pred], -1).astype(np.uint8), updated_image_path, product='label')
+        print(f"\nProcessed Instance Segmentation, Input Image: {image_path + ',' + det_prompt}, Output SegMap: {updated_image_path}, {summary}")
+        return updated_image_path + '. ' + summary
 
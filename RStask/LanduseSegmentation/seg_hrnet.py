@@ -4,8 +4,11 @@ import torch
 import torch.nn as nn
 import torch._utils
 import torch.nn.functional as F
-from PIL import Image
 import numpy as np
+from RStask.Common.Vectorize import summarize_label_map
+from RStask.Common.FeatureCache import FeatureCache, feature_cache, array_hash
+from RStask.Common.Quality import get_quality, is_identity, tta_dense
+from RStask.Common.OutputWriter import write_output
 
 
 BatchNorm2d=nn.BatchNorm2d
@@ -378,6 +381,10 @@ class hrmodel(nn.Module):
         return nn.Sequential(*modules), num_inchannels
 
     def forward(self, x,gts=None):
+        return self.head(self.features(x))
+
+    def features(self, x):
+        """Multi-scale stage4 outputs of the HRNet backbone."""
         x = self.conv1(x)
         x = self.bn1(x)
         x = self.relu(x)
@@ -414,8 +421,9 @@ class hrmodel(nn.Module):
                     x_list.append(self.transition3[i](y_list[-1]))
             else:
                 x_list.append(y_list[i])
-        x = self.stage4(x_list)
-        # return x
+        return self.stage4(x_list)
+
+    def head(self, x):
         # Upsampling
         x0_h, x0_w = x[0].size(2), x[0].size(3)
         x1 = F.interpolate(x[1], size=(x0_h, x0_w), mode='bilinear', align_corners=ALIGN_CORNERS)
@@ -470,28 +478,39 @@ class HRNet48(nn.Module):
         return vis
 
 
-    def inference(self,image_path, det_prompt,updated_image_path):
+    def inference(self,image_path, det_prompt,updated_image_path, quality=None):
         det_prompt=det_prompt.strip()
-        image = torch.from_numpy(io.imread(image_path))
+        preset = get_quality(quality)
+        image = io.imread(image_path)
+        key = FeatureCache.make_key(array_hash(image), 'hrnet48_loveda', image.shape[:2])
+        image = torch.from_numpy(image)
         image = (image.permute(2, 0, 1).unsqueeze(0) - self.mean) / self.std
         with torch.no_grad():
             b, c, h, w = image.shape
-            pred = self.model(image.to(self.device))
-            pred = F.interpolate(pred, (h, w), mode='bilinear')
+            if is_identity(preset):
+                features = feature_cache.get_or_compute(key, lambda: self.model.features(image.to(self.device)))
+                pred = self.model.head(features)
+                pred = F.interpolate(pred, (h, w), mode='bilinear')
+            else:
+                pred = tta_dense(self.model, image.to(self.device), preset, out_size=(h, w))
         pred = pred.argmax(1).cpu().squeeze().int().numpy()
         if det_prompt.lower() == 'landuse':
             pred_vis = self.visualize(pred, self.category)
+            classes = None
         elif det_prompt.lower() in [i.lower() for i in self.category]:
             idx=[i.lower() for i in self.category].index(det_prompt.strip().lower())
             pred_vis = self.visualize(pred, [idx])
+            classes = [idx]
         else:
             print('Category ',det_prompt,' do not suuport!')
             return ('Category ',det_prompt,' do not suuport!','The expected input category include Building, Road, Water, Barren, Forest, Farmland, Landuse.')
 
-        pred = Image.fromarray(pred_vis.astype(np.uint8))
-        pred.save(updated_image_path)
-        print(f"\nProcessed Landuse Segmentation, Input Image: {image_path+','+det_prompt}, Output: {updated_image_path}")
-        return det_prompt+' segmentation result in '+updated_image_path
+        summary, _, _ = summarize_label_map(pred, self.category, geojson_path=updated_image_path[:-4] + '.geojson',
+                                            classes=classes, ignore=(0,))
+        # 后台编码写出
+        write_output(pred_vis.astype(np.uint8), updated_image_path)
+        print(f"\nProcessed Landuse Segmentation, Input Image: {image_path+','+det_prompt}, Output: {updated_image_path}, {summary}")
+        return det_prompt+' segmentation result in '+updated_image_path+'. '+summary
 
 if __name__=='__main__':
     net=HRNet48()
@@ -4,6 +4,7 @@ from skimage import io
 import numpy as np
 import torchvision
 import torch.nn.functional as F
+from RStask.Common.Quality import get_quality, detection_views, scale_input
 class YoloCounting:
     def __init__(self, device):
         from RStask.ObjectDetection.models.common import DetectMultiBackend
@@ -26,7 +27,7 @@ class YoloCounting:
                          'basketball court', 'bridge', 'helicopter']
 
 
-    def inference(self, image_path, det_prompt):
+    def inference(self, image_path, det_prompt, quality=None):
         supported_class=False
         for i in range(len(self.category)):
             if self.category[i] == det_prompt or self.category[i] == det_prompt[:-1] or self.category[i] == det_prompt[:-3]:
@@ -36,11 +37,15 @@ class YoloCounting:
             print(f"\nProcessed Object Counting, Input Image: {image_path}, Output text: {log_text}")
             return log_text
 
+        preset = get_quality(quality)
+        views = detection_views(preset)
         image = torch.from_numpy(io.imread(image_path))
         image = image.permute(2, 0, 1).unsqueeze(0) / 255.0
         _, _, h, w = image.shape
+        # 计数只使用类别，缩小输入后无需还原检测框
+        image, _ = scale_input(image, preset['input_scale'])
         with torch.no_grad():
-            out, _ = self.model(image.to(self.device), augment=False,val=True)
+            out, _ = self.model(image.to(self.device), augment=views if len(views) > 1 else False,val=True)
             predn = self.non_max_suppression(out, conf_thres=0.001, iou_thres=0.75, labels=[], multi_label=True,
                                              agnostic=False)[0]
             detections = predn.clone()
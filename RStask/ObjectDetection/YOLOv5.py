@@ -4,7 +4,8 @@ from skimage import io
 import numpy as np
 import torchvision
 import cv2
-from PIL import Image
+from RStask.Common.Quality import get_quality, detection_views, scale_input
+from RStask.Common.OutputWriter import write_output
 class YoloDetection:
     def __init__(self, device):
         import os
@@ -25,37 +26,70 @@ class YoloDetection:
                          'soccer ball field', 'tennis court', 'swimming pool', 'baseball diamond', 'roundabout',
                          'basketball court', 'bridge', 'helicopter']
 
-    def inference(self, image_path, det_prompt,updated_image_path):
-        image = torch.from_numpy(io.imread(image_path))
+    def detect(self, image, quality=None):
+        """
+        对内存中的图像做目标检测
+
+        Args:
+            image: [H, W, 3] uint8 数组
+            quality: 质量档位
+
+        Returns:
+            detections: [N, 6] 张量 (x1, y1, x2, y2, conf, cls)，已按置信度 0.75 过滤
+        """
+        # fast 档位缩小输入；accurate 档位按档位的尺度与翻转做增强（各视图合并为一个 batch）
+        preset = get_quality(quality)
+        views = detection_views(preset)
+        image = torch.from_numpy(np.ascontiguousarray(image))
         image = image.permute(2, 0, 1).unsqueeze(0) / 255.0
-        _, _, h, w = image.shape
+        image, (ry, rx) = scale_input(image, preset['input_scale'])
         with torch.no_grad():
-            out, _ = self.model(image.to(self.device), augment=False,val=True)
+            out, _ = self.model(image.to(self.device), augment=views if len(views) > 1 else False,val=True)
             predn = self.non_max_suppression(out, conf_thres=0.001, iou_thres=0.75, labels=[], multi_label=True,
                                              agnostic=False)[0]
-            detections = predn.clone()
-            detections = detections[predn[:, 4] > 0.75]
-            detections_box = (detections[:, :4] / (640 / h)).int().cpu().numpy()
-            detection_classes = detections[:, 5].int().cpu().numpy()
+            detections = predn[predn[:, 4] > 0.75].clone()
+            # 检测框还原到原图坐标
+            detections[:, [0, 2]] /= rx
+            detections[:, [1, 3]] /= ry
+            return detections
+
+    def inference(self, image_path, det_prompt,updated_image_path, quality=None):
+        image = io.imread(image_path)
+        h = image.shape[0]
+        detections = self.detect(image, quality=quality)
+        detections_box = (detections[:, :4] / (640 / h)).int().cpu().numpy()
+        detection_classes = detections[:, 5].int().cpu().numpy()
         if len(detection_classes) > 0:
-            det = np.zeros((h, w, 3))
+            det = np.zeros(image.shape[:2] + (3,))
             for i in range(len(detections_box)):
                 x1, y1, x2, y2 = detections_box[i]
                 det[y1:y2, x1:x2] = detection_classes[i] + 1
 
-            self.visualize(image_path,updated_image_path,detections)
+            self.visualize(image, updated_image_path, detections)
             print(
                 f"\nProcessed Object Detection, Input Image: {image_path}, Output Bounding box: {updated_image_path},Output text: {'Object Detection Done'}")
             return  det_prompt+' object detection result in '+updated_image_path
-    def visualize(self,image_path, newpic_path,detections):
+
+    def draw(self, im, detections):
+        """在图像副本上绘制检测框与类别名，返回 uint8 数组"""
         font = cv2.FONT_HERSHEY_SIMPLEX
-        im = io.imread(image_path)
+        im = np.array(im, dtype=np.uint8)
         boxes = detections.int().cpu().numpy()
         for i in range(len(boxes)):
             cv2.rectangle(im, (boxes[i][0], boxes[i][1]), (boxes[i][2], boxes[i][3]), (0, 255, 255), 2)
             cv2.rectangle(im, (boxes[i][0], boxes[i][1] - 15), (boxes[i][0] + 45, boxes[i][1] - 2), (0, 0, 255),thickness=-1)
             cv2.putText(im, self.category[boxes[i][-1]], (boxes[i][0], boxes[i][1] - 2), font, 0.5, (255, 255, 255),1)
-        Image.fromarray(im.astype(np.uint8)).save(newpic_path)
+        return im
+
+    def visualize(self,image, newpic_path,detections):
+        """保存检测可视化结果与同名 .txt 检测框列表；image 为图像路径或数组"""
+        im = io.imread(image) if isinstance(image, str) else image
+        write_output(self.draw(im, detections), newpic_path)
+        self.write_boxes(newpic_path, detections)
+
+    def write_boxes(self, newpic_path, detections):
+        """检测框列表写到与结果图同名的 .txt"""
+        boxes = detections.int().cpu().numpy()
         with open(newpic_path[:-4]+'.txt','w') as f:
             for i in range(len(boxes)):
                 f.write(str(list(boxes[i,:4]))[1:-1]+', '+self.category[boxes[i][-1]]+'\n')
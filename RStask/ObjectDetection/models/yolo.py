@@ -130,22 +130,26 @@ class Model(nn.Module):
         LOGGER.info('')
 
     def forward(self, x, augment=False, profile=False, visualize=False):
+        # augment may be True (default views) or a list of (scale, flip dim) views
         if augment:
-            return self._forward_augment(x)  # augmented inference, None
+            return self._forward_augment(x, None if augment is True else augment)  # augmented inference, None
         return self._forward_once(x, profile, visualize)  # single-scale inference, train
 
-    def _forward_augment(self, x):
+    def _forward_augment(self, x, views=None):
         img_size = x.shape[-2:]  # height, width
-        s = [1, 0.83, 0.67]  # scales
-        f = [None, 3, None]  # flips (2-ud, 3-lr)
-        y = []  # outputs
-        for si, fi in zip(s, f):
-            xi = scale_img(x.flip(fi) if fi else x, si, gs=int(self.stride.max()))
-            yi = self._forward_once(xi)[0]  # forward
-            # cv2.imwrite(f'img_{si}.jpg', 255 * xi[0].cpu().numpy().transpose((1, 2, 0))[:, :, ::-1])  # save
-            yi = self._descale_pred(yi, fi, si, img_size)
-            y.append(yi)
-        y = self._clip_augmented(y)  # clip augmented tails
+        if views is None:
+            s = [1, 0.83, 0.67]  # scales
+            f = [None, 3, None]  # flips (2-ud, 3-lr)
+        else:
+            s, f = (list(v) for v in zip(*views))
+        # all views are padded to the largest view shape and run as one batch instead of len(s) sequential passes
+        xs = [scale_img(x.flip(fi) if fi else x, si, gs=int(self.stride.max())) for si, fi in zip(s, f)]
+        h, w = max(xi.shape[2] for xi in xs), max(xi.shape[3] for xi in xs)
+        xs = [nn.functional.pad(xi, [0, w - xi.shape[3], 0, h - xi.shape[2]], value=0.447) for xi in xs]
+        yb = self._forward_once(torch.cat(xs, 0))[0]  # forward
+        y = [self._descale_pred(yi, fi, si, img_size) for yi, si, fi in zip(yb.chunk(len(s), 0), s, f)]
+        if views is None:
+            y = self._clip_augmented(y)  # clip augmented tails (assumes the default scale order)
         return torch.cat(y, 1), None  # augmented inference, train
 
     def _forward_once(self, x, profile=False, visualize=False):
@@ -0,0 +1,170 @@
+import os
+import time
+import numpy as np
+from PIL import Image
+from RStask.Common.OutputWriter import write_output, wait_outputs
+
+# 阶段名称及别名 -> 规范名称
+STAGE_ALIASES = {
+    'cloud_removal': 'cloud_removal', 'cloud': 'cloud_removal', 'dehaze': 'cloud_removal',
+    'denoise': 'denoise', 'denoising': 'denoise',
+    'super_resolution': 'super_resolution', 'sr': 'super_resolution', 'upscale': 'super_resolution',
+    'edge': 'edge', 'canny': 'edge',
+    'detect': 'detect', 'detection': 'detect',
+}
+# 只能作为最后一个阶段（输出不再是可继续处理的图像）
+TERMINAL_STAGES = ('detect',)
+# 阶段 -> 按需创建工具时使用的 RStask 工具函数名
+STAGE_FUNCTIONS = {
+    'cloud_removal': 'CloudRemovalFunction',
+    'denoise': 'DenoisingFunction',
+    'super_resolution': 'SuperResolutionFunction',
+    'edge': 'ImageEdgeFunction',
+    'detect': 'DetectionFunction',
+}
+
+
+def parse_chain(spec):
+    """
+    解析处理链描述，如 'cloud_removal|denoise|detect:plane'
+
+    Returns:
+        stages: [(阶段名, 参数或 None), ...]
+    """
+    stages = []
+    for part in spec.split('|'):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition(':')
+        key = name.strip().lower()
+        if key not in STAGE_ALIASES:
+            raise ValueError(f"Unknown pipeline stage {name.strip()!r}, expected one of {sorted(STAGE_FUNCTIONS)}")
+        stages.append((STAGE_ALIASES[key], arg.strip() or None))
+    if not stages:
+        raise ValueError("Empty pipeline specification")
+    for name, _ in stages[:-1]:
+        if name in TERMINAL_STAGES:
+            raise ValueError(f"Stage {name!r} must be the last stage of a pipeline")
+    return stages
+
+
+class ImageChain:
+    """
+    在内存中串联多个图像处理工具：各阶段之间直接传递数组，只写出最终结果（可选写出中间结果），
+    并记录每个阶段的耗时
+
+    Args:
+        tools: {阶段名: 已加载的工具实例}，未给出的工具在首次使用时创建（检测模型使用 device）
+        device: 按需创建检测模型时使用的设备
+    """
+    def __init__(self, tools=None, device='cpu'):
+        print("Initializing ImageChain")
+        self.tools = dict(tools or {})
+        self.device = device
+
+    def get_tool(self, stage):
+        if stage not in self.tools:
+            import RStask
+            function = getattr(RStask, STAGE_FUNCTIONS[stage])
+            self.tools[stage] = function(self.device) if stage == 'detect' else function()
+        return self.tools[stage]
+
+    def detect_target(self, arg):
+        """
+        检测阶段参数对应的类别下标；与计数工具一致，类别名允许复数形式（'planes' / 'ships' / 'vehicles' 等）
+
+        Returns:
+            index: 类别下标，未给出参数时为 None（保留全部类别）
+        """
+        if not arg:
+            return None
+        category = self.get_tool('detect').category
+        name = arg.strip().lower()
+        for i, c in enumerate(category):
+            if c in (name, name[:-1], name[:-3]):
+                return i
+        raise ValueError(f"{arg} is not a supported category for the detection model, expected one of {category}")
+
+    def run_stage(self, stage, arg, image, quality=None):
+        """
+        执行单个阶段；检测阶段给出类别参数（如 'detect:plane'）时只保留该类别的检测结果，类别不受支持时抛出 ValueError
+
+        Returns:
+            image: 阶段输出的 [H, W, 3] uint8 数组
+            extra: 检测阶段为 (结果说明文本, 检测结果)，其余阶段为 None
+        """
+        tool = self.get_tool(stage)
+        if stage in ('cloud_removal', 'denoise'):
+            return tool.process(image), None
+        if stage == 'super_resolution':
+            return tool.process(image, scale=float(arg) if arg else None), None
+        if stage == 'edge':
+            return tool.to_rgb(tool.process(image)), None
+        target = self.detect_target(arg)
+        detections = tool.detect(image, quality=quality)
+        if target is not None:
+            # 只保留请求的类别，绘制、计数与检测框列表都基于过滤后的结果
+            detections = detections[detections[:, 5].int() == target]
+        classes = detections[:, 5].int().cpu().numpy()
+        counts = {}
+        for c in classes:
+            counts[tool.category[c]] = counts.get(tool.category[c], 0) + 1
+        found = ', '.join(f"{name}: {n}" for name, n in sorted(counts.items(), key=lambda kv: -kv[1]))
+        info = f"{arg or 'object'} detection: {found or 'nothing detected'}"
+        return tool.draw(image, detections), (info, detections)
+
+    def run(self, image_path, spec, output_path, save_intermediates=False, quality=None):
+        """
+        Args:
+            image_path: 输入图像路径
+            spec: 处理链描述，阶段之间用 '|' 分隔，阶段参数用 ':' 给出（如 'super_resolution:4'、'detect:plane'）
+            output_path: 最终结果路径
+            save_intermediates: 是否把每个中间阶段的结果也写到 output_path 同目录
+            quality: 检测阶段的质量档位
+
+        Returns:
+            result: {'output': 最终结果路径, 'stages': [{'stage', 'arg', 'seconds', 'shape', 'path'}],
+                     'info': 检测结果说明或 None}
+        """
+        stages = parse_chain(spec)
+        for stage, arg in stages:
+            if stage == 'detect':
+                # 先检查类别，避免前面的阶段白跑
+                self.detect_target(arg)
+        wait_outputs(image_path)
+        image = np.array(Image.open(image_path).convert('RGB'))
+        root, ext = os.path.splitext(output_path)
+        records, info = [], None
+        for i, (stage, arg) in enumerate(stages):
+            start = time.perf_counter()
+            image, extra = self.run_stage(stage, arg, image, quality=quality)
+            record = {'stage': stage, 'arg': arg, 'seconds': time.perf_counter() - start, 'shape': image.shape,
+                      'path': None}
+            last = i == len(stages) - 1
+            if save_intermediates and not last:
+                record['path'] = f"{root}_{i + 1}_{stage}{ext}"
+                # 中间结果在后台编码，不阻塞下一阶段
+                write_output(image, record['path'])
+            if extra is not None:
+                info, detections = extra
+                # 与检测工具一致，检测框列表写到同名 .txt
+                self.get_tool(stage).write_boxes(output_path, detections)
+            records.append(record)
+        write_output(image, output_path)
+        records[-1]['path'] = output_path
+        return {'output': output_path, 'stages': records, 'info': info}
+
+    def inference(self, image_path, spec, output_path, save_intermediates=False, quality=None):
+        result = self.run(image_path, spec, output_path, save_intermediates=save_intermediates, quality=quality)
+        timings = ', '.join(f"{r['stage']}{':' + r['arg'] if r['arg'] else ''} {r['seconds']:.2f}s"
+                            for r in result['stages'])
+        total = sum(r['seconds'] for r in result['stages'])
+        output_txt = f"Pipeline result saved to {output_path}. Stage timings: {timings} (total {total:.2f}s)."
+        if result['info']:
+            output_txt += ' ' + result['info'][0].upper() + result['info'][1:] + '.'
+        intermediates = [r['path'] for r in result['stages'][:-1] if r['path']]
+        if intermediates:
+            output_txt += ' Intermediate results: ' + ', '.join(intermediates) + '.'
+        print(f"\nProcessed ImageChain, Input Image: {image_path}, Output Image: {output_path}, Output text: {output_txt}")
+        return output_txt
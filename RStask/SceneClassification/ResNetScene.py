@@ -1,6 +1,12 @@
 import torch
 import os
+import numpy as np
+import cv2
 from skimage import io
+from RStask.Common.Tiling import tile_grid, batched
+from RStask.Common.FeatureCache import FeatureCache, feature_cache, array_hash
+from RStask.Common.Quality import get_quality, is_identity, tta_classify
+from RStask.Common.OutputWriter import write_output
 
 class ResNetAID:
     def __init__(self, device=None):
@@ -16,15 +22,19 @@ class ResNetAID:
             if not os.path.exists(model_path):
                 # 备选路径2: 相对路径
                 model_path = '../../checkpoints/Res34_AID_best.pth'
-        
+
         print(f"Loading model from: {model_path}")
         trained = torch.load(model_path)
 
         self.model.load_state_dict(trained)
         self.model = self.model.to(device)
         self.model.eval()
-        self.mean, self.std = torch.tensor([123.675, 116.28, 103.53]).reshape((1, 3, 1, 1)), torch.tensor(
-            [58.395, 57.12, 57.375]).reshape((1, 3, 1, 1))
+        # 归一化参数常驻设备，uint8 图像上传后在设备端完成归一化
+        self.mean, self.std = torch.tensor([123.675, 116.28, 103.53], device=device).reshape((1, 3, 1, 1)), torch.tensor(
+            [58.395, 57.12, 57.375], device=device).reshape((1, 3, 1, 1))
+        self.batch_size = 32
+        self.backbone_id = 'resnet34_aid'
+        self.tile_size = 256
         self.all_dict = {'Bridge': 0, 'Medium Residential': 1, 'Park': 2, 'Stadium': 3, 'Church': 4,
                          'Dense Residential': 5, 'Farmland': 6,
                          'River': 7, 'School': 8, 'Sparse Residential': 9, 'Viaduct': 10, 'Beach': 11, 'Forest': 12,
@@ -32,20 +42,150 @@ class ResNetAID:
                          'Railway Station': 16, 'Center': 17, 'Industrial': 18, 'Meadow': 19, 'Airport': 20,
                          'Storage Tanks': 21, 'Pond': 22, 'Commercial': 23, 'Resort': 24,
                          'Parking': 25, 'Port': 26, 'Square': 27, 'Mountain': 28, 'Playground': 29}
+        self.category = list(self.all_dict.keys())
 
+    def read_image(self, image_path):
+        """读取图像为 [H, W, 3] uint8 数组"""
+        image = io.imread(image_path)
+        if image.ndim == 2:
+            image = np.stack([image, image, image], -1)
+        return np.ascontiguousarray(image[:, :, :3])
 
-    def inference(self, inputs):
-        image_path = inputs
-        image = torch.from_numpy(io.imread(image_path))
-        image = (image.permute(2, 0, 1).unsqueeze(0) - self.mean) / self.std
+    def backbone(self, batch):
+        """ResNet34 多尺度特征 (layer1 ~ layer4)"""
+        m = self.model
+        x = m.maxpool(m.relu(m.bn1(m.conv1(batch))))
+        c2 = m.layer1(x)
+        c3 = m.layer2(c2)
+        c4 = m.layer3(c3)
+        c5 = m.layer4(c4)
+        return c2, c3, c4, c5
+
+    def head(self, c5):
+        return self.model.fc(torch.flatten(self.model.avgpool(c5), 1))
+
+    def features(self, images):
+        """对同尺寸 uint8 图像批量提取 backbone 特征"""
+        batch = torch.as_tensor(images).to(self.device, non_blocking=True)
+        batch = (batch.permute(0, 3, 1, 2).float() - self.mean) / self.std
         with torch.no_grad():
-            pred = self.model(image.to(self.device))
+            return self.backbone(batch)
+
+    def predict(self, images, use_cache=True, quality=None):
+        """对同尺寸图像批量推理，已缓存特征的图像只运行分类头
+
+        Args:
+            images: [B, H, W, 3] uint8 数组
+            use_cache: 是否读写共享特征缓存
+            quality: 质量档位，非默认档位时走测试时增强且不使用缓存
+
+        Returns:
+            probs: [B, num_classes] softmax 概率（位于设备上）
+        """
+        images = np.asarray(images)
+        preset = get_quality(quality)
+        if not is_identity(preset):
+            batch = torch.as_tensor(images).to(self.device, non_blocking=True)
+            batch = (batch.permute(0, 3, 1, 2).float() - self.mean) / self.std
+            return tta_classify(lambda x: self.head(self.backbone(x)[-1]), batch, preset)
+        if use_cache:
+            keys = [FeatureCache.make_key(array_hash(image), self.backbone_id, image.shape[:2]) for image in images]
+            feats = [feature_cache.get(key) for key in keys]
+        else:
+            feats = [None] * len(images)
+        missing = [i for i, f in enumerate(feats) if f is None]
+        if missing:
+            computed = self.features(images[missing])
+            for j, i in enumerate(missing):
+                feats[i] = tuple(f[j:j + 1].clone() if len(missing) > 1 else f for f in computed)
+                if use_cache:
+                    feature_cache.put(keys[i], feats[i])
+        with torch.no_grad():
+            pred = self.head(torch.cat([f[-1] for f in feats]))
+        return torch.softmax(pred, 1)
+
+    def format_topk(self, probs, topk):
+        values, indices = probs.topk(topk, dim=1, largest=True, sorted=True)
+        values, indices = values.cpu().numpy(), indices.cpu().numpy()
+        return [[{'label': self.category[j], 'prob': float(v)} for v, j in zip(values[i], indices[i])]
+                for i in range(len(values))]
 
-        values, indices = torch.softmax(pred, 1).topk(2, dim=1, largest=True, sorted=True)
+    def inference_batch(self, image_paths, topk=2, batch_size=None, quality=None):
+        """批量场景分类，尺寸相同的图像合并为一个 batch
+
+        Args:
+            image_paths: 图像路径列表
+            topk: 返回的候选类别数
+            batch_size: 每个 batch 的最大图像数
+            quality: 质量档位 fast / balanced / accurate
+
+        Returns:
+            results: 与输入顺序一致的列表，每项为 {'image': 路径, 'topk': [{'label', 'prob'}, ...]}
+        """
+        batch_size = batch_size or self.batch_size
+        images = [self.read_image(p) for p in image_paths]
+        groups = {}
+        for i, image in enumerate(images):
+            groups.setdefault(image.shape, []).append(i)
+        results = [None] * len(images)
+        for indices in groups.values():
+            for chunk in batched(indices, batch_size):
+                probs = self.predict(np.stack([images[i] for i in chunk]), quality=quality)
+                for i, top in zip(chunk, self.format_topk(probs, topk)):
+                    results[i] = {'image': image_paths[i], 'topk': top}
+        return results
+
+    def classify_tiles(self, image_path, tile_size=None, overlap=None, topk=1, batch_size=None, save_path=None,
+                       quality=None):
+        """把大幅影像切分为窗口批量分类，得到窗口粒度的粗场景类别图
+
+        Args:
+            image_path: 图像路径
+            tile_size: 窗口边长
+            overlap: 相邻窗口的重叠像素数，默认取质量档位的切片重叠
+            topk: 每个窗口返回的候选类别数
+            batch_size: 每个 batch 的最大窗口数
+            save_path: 可选，保存彩色场景类别图
+            quality: 质量档位 fast / balanced / accurate
+
+        Returns:
+            result: {'grid': [rows, cols] 类别编号, 'prob': [rows, cols] 置信度,
+                     'tiles': 每个窗口的 {'y', 'x', 'topk'}, 'summary': 各类别窗口占比文本}
+        """
+        tile_size = tile_size or self.tile_size
+        batch_size = batch_size or self.batch_size
+        if overlap is None:
+            overlap = get_quality(quality)['tile_overlap']
+        image = self.read_image(image_path)
+        h, w = image.shape[:2]
+        ys, xs = tile_grid(h, w, tile_size, overlap)
+        windows = [(r, c) for r in range(len(ys)) for c in range(len(xs))]
+        grid = np.zeros((len(ys), len(xs)), dtype=np.int64)
+        grid_prob = np.zeros((len(ys), len(xs)), dtype=np.float32)
+        tiles = []
+        for chunk in batched(windows, batch_size):
+            crops = np.stack([image[ys[r]:ys[r] + tile_size, xs[c]:xs[c] + tile_size] for r, c in chunk])
+            probs = self.predict(crops, use_cache=False, quality=quality)
+            for (r, c), top in zip(chunk, self.format_topk(probs, topk)):
+                grid[r, c] = self.all_dict[top[0]['label']]
+                grid_prob[r, c] = top[0]['prob']
+                tiles.append({'y': ys[r], 'x': xs[c], 'topk': top})
+
+        counts = np.bincount(grid.ravel(), minlength=len(self.category))
+        order = np.argsort(counts)[::-1]
+        summary = ', '.join(f"{self.category[i]} {counts[i] / grid.size * 100:.1f}%" for i in order if counts[i] > 0)
+        if save_path is not None:
+            rng = np.random.RandomState(0)
+            palette = rng.randint(0, 255, (len(self.category), 3)).astype(np.uint8)
+            vis = cv2.resize(palette[grid], (w, h), interpolation=cv2.INTER_NEAREST)
+            write_output(vis, save_path)
+        return {'grid': grid, 'prob': grid_prob, 'tiles': tiles, 'summary': summary}
+
+    def inference(self, inputs, quality=None):
+        image_path = inputs
+        top = self.inference_batch([image_path], topk=2, quality=quality)[0]['topk']
         output_txt = image_path + ' has ' + str(
-            torch.round(values[0][0] * 10000).item() / 100) + '% probability being ' + list(self.all_dict.keys())[
-                         indices[0][0]] + ' and ' + str(
-            torch.round(values[0][1] * 10000).item() / 100) + '% probability being ' + list(self.all_dict.keys())[
-                         indices[0][1]]+'.'
+            round(top[0]['prob'] * 10000) / 100) + '% probability being ' + top[0]['label'] + ' and ' + str(
+            round(top[1]['prob'] * 10000) / 100) + '% probability being ' + top[1]['label'] + '.'
         print(f"\nProcessed Scene Classification, Input Image: {inputs}, Output Scene: {output_txt}")
         return output_txt
\ No newline at end of file
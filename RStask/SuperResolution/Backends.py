@@ -0,0 +1,57 @@
+import importlib
+import cv2
+import numpy as np
+from RStask.Common.CPUPolicy import to_device, to_array
+
+
+def output_size(img, scale):
+    h, w = img.shape[:2]
+    return int(h * scale), int(w * scale)
+
+
+class BicubicBackend:
+    """双三次插值 + 3x3 锐化，最快的超分后端"""
+    name = 'bicubic'
+    # 双三次插值 4x4 邻域 + 输出端 3x3 锐化，输入端 4 像素 halo 足够
+    halo = 4
+
+    def __init__(self, device=None):
+        self.kernel = np.array([[-1, -1, -1],
+                                [-1,  9, -1],
+                                [-1, -1, -1]], dtype=np.float32)
+
+    def upscale(self, img, scale, out_size=None):
+        """
+        Args:
+            img: [H, W] 或 [H, W, C] uint8 数组
+            scale: 放大倍数
+            out_size: 可选的输出尺寸 (h, w)，切片执行时由执行器给出
+
+        Returns:
+            result: 放大后的 uint8 数组
+        """
+        new_h, new_w = out_size or output_size(img, scale)
+        # 使用双三次插值进行超分辨率
+        result = cv2.resize(to_device(img), (new_w, new_h), interpolation=cv2.INTER_CUBIC)
+        # 应用锐化滤波器增强细节（uint8 输出自动饱和到 [0, 255]）
+        return to_array(cv2.filter2D(result, -1, self.kernel))
+
+
+# 后端名称 -> (模块, 类名)；学习型后端依赖 torch，按需导入
+_BACKENDS = {
+    'bicubic': (__name__, 'BicubicBackend'),
+    'espcn': ('RStask.SuperResolution.ESPCN', 'ESPCNBackend'),
+}
+
+
+def available_backends():
+    return sorted(_BACKENDS)
+
+
+def create_backend(name, device=None, **kwargs):
+    """按名称创建超分后端"""
+    name = (name or 'bicubic').lower()
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown super-resolution backend {name!r}, expected one of {available_backends()}")
+    module, attr = _BACKENDS[name]
+    return getattr(importlib.import_module(module), attr)(device=device, **kwargs)
@@ -1,48 +1,62 @@
-from PIL import Image
-import cv2
 import numpy as np
+import threading
+from RStask.Common.TileExecutor import TileExecutor, DEFAULT_TILE_SIZE, open_raster
+from RStask.Common.OutputWriter import write_output
+from RStask.SuperResolution.Backends import create_backend
 
 class BicubicSuperResolution:
-    """基于双三次插值的超分辨率算法"""
-    def __init__(self):
+    """超分辨率工具：默认使用双三次插值后端，可切换为 ESPCN 等学习型后端"""
+    def __init__(self, device=None, backend='bicubic'):
         print("Initializing BicubicSuperResolution")
         self.scale_factor = 2  # 默认放大2倍
-        
-    def inference(self, inputs, new_image_name, scale=None):
-        """执行超分辨率处理
+        self.tile_size = DEFAULT_TILE_SIZE
+        self.device = device
+        self.default_backend = backend
+        self.backends = {}
+        self.lock = threading.Lock()
+
+    def get_backend(self, name=None):
+        """按名称获取（并缓存）超分后端"""
+        name = (name or self.default_backend).lower()
+        with self.lock:
+            if name not in self.backends:
+                self.backends[name] = create_backend(name, device=self.device)
+            return self.backends[name]
+
+    def process(self, img, scale=None, out_size=None, backend=None):
+        """
+        对内存中的图像做超分辨率
+
+        Args:
+            img: [H, W] 或 [H, W, C] uint8 数组
+            scale: 放大倍数，默认为 self.scale_factor
+            out_size: 可选的输出尺寸 (h, w)，切片执行时由执行器给出
+            backend: 后端名称，默认为 self.default_backend
+
+        Returns:
+            result: 放大后的 uint8 数组
+        """
+        return self.get_backend(backend).upscale(img, scale or self.scale_factor, out_size=out_size)
+
+    def inference(self, inputs, new_image_name, scale=None, tile_size=None, backend=None):
+        """执行超分辨率处理；放大倍数与后端只作用于本次请求，不修改实例状态，可并发调用
         
         Args:
-            inputs: 输入图像路径
+            inputs: 输入图像路径（.npy 以内存映射读取）
             new_image_name: 输出图像路径
             scale: 放大倍数，默认为2
+            tile_size: 输入端切片大小，最长边超过该值时按切片执行，默认为 self.tile_size
+            backend: 后端名称 bicubic / espcn，默认为 self.default_backend
         """
-        if scale is not None:
-            self.scale_factor = scale
-            
-        image = Image.open(inputs)
-        img = np.array(image)
-        
-        # 获取原始尺寸
-        h, w = img.shape[:2]
-        new_h = int(h * self.scale_factor)
-        new_w = int(w * self.scale_factor)
-        
-        # 使用双三次插值进行超分辨率
-        result = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_CUBIC)
-        
-        # 应用锐化滤波器增强细节
-        kernel = np.array([[-1, -1, -1],
-                          [-1,  9, -1],
-                          [-1, -1, -1]]) / 1.0
-        result = cv2.filter2D(result, -1, kernel)
-        
-        # 确保像素值在有效范围内
-        result = np.clip(result, 0, 255).astype(np.uint8)
-        
-        # 保存结果
-        result_image = Image.fromarray(result)
-        result_image.save(new_image_name)
-        
-        print(f"\nProcessed SuperResolution, Input Image: {inputs}, Output Image: {new_image_name}, Scale: {self.scale_factor}x")
+        scale = scale or self.scale_factor
+        sr = self.get_backend(backend)
+        img = open_raster(inputs)
+        executor = TileExecutor(tile_size or self.tile_size, halo=sr.halo, scale=scale)
+        if executor.needs_tiling(img.shape):
+            executor.write(img, lambda tile, size: sr.upscale(tile, scale, out_size=size), new_image_name)
+        else:
+            # 保存结果（后台编码）
+            write_output(sr.upscale(np.ascontiguousarray(img), scale), new_image_name)
+        
+        print(f"\nProcessed SuperResolution, Input Image: {inputs}, Output Image: {new_image_name}, Scale: {scale}x, Backend: {sr.name}")
         return None
-
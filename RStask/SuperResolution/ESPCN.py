@@ -0,0 +1,125 @@
+import os
+import threading
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from RStask.Common.TileExecutor import TileExecutor
+from RStask.Common.Tiling import batched
+from RStask.SuperResolution.Backends import output_size
+
+
+class ESPCN(nn.Module):
+    """
+    ESPCN 亚像素卷积超分网络，在低分辨率空间提取特征后用 PixelShuffle 放大
+
+    网络预测相对双三次上采样的残差，最后一层零初始化：未加载权重时输出即为双三次插值结果，
+    随机初始化的模型也能给出合理的输出
+    """
+    def __init__(self, scale=2, channels=3, features=64):
+        super(ESPCN, self).__init__()
+        self.scale = scale
+        self.body = nn.Sequential(
+            nn.Conv2d(channels, features, 5, padding=2), nn.Tanh(),
+            nn.Conv2d(features, features // 2, 3, padding=1), nn.Tanh(),
+            nn.Conv2d(features // 2, channels * scale * scale, 3, padding=1),
+        )
+        self.shuffle = nn.PixelShuffle(scale)
+        nn.init.zeros_(self.body[-1].weight)
+        nn.init.zeros_(self.body[-1].bias)
+
+    def forward(self, x):
+        """x: [B, C, H, W]，取值 [0, 1]"""
+        base = F.interpolate(x, scale_factor=self.scale, mode='bicubic', align_corners=False)
+        return base + self.shuffle(self.body(x))
+
+
+def find_weights(scale):
+    """按放大倍数查找 ESPCN 权重，找不到时返回 None"""
+    name = f'espcn_x{scale}.pth'
+    for root in ('/root/autodl-tmp/tool_models/', '/root/Remote-Sensing-ChatGPT/checkpoints/', '../../checkpoints/'):
+        path = os.path.join(root, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class ESPCNBackend:
+    """
+    ESPCN 超分后端：整数倍放大由网络完成，非整数倍先按向上取整的倍数放大再缩小到目标尺寸；
+    图像切成固定大小的带 halo 窗口批量推理，显存 / 内存占用与图像大小无关
+    """
+    name = 'espcn'
+    # 网络感受野半径 4（5x5 + 3x3 + 3x3），双三次分支 2，留出余量
+    halo = 8
+
+    def __init__(self, device=None, weights=None, tile_size=256, batch_size=8):
+        self.device = device or 'cpu'
+        self.weights = weights or {}
+        self.tile_size = tile_size
+        self.batch_size = batch_size
+        self.models = {}
+        self.lock = threading.Lock()
+
+    def get_model(self, scale):
+        """按放大倍数懒加载模型，多个请求并发时只构建一次"""
+        with self.lock:
+            if scale not in self.models:
+                model = ESPCN(scale)
+                path = self.weights.get(scale) or find_weights(scale)
+                if path is not None:
+                    print(f"Loading ESPCN x{scale} from: {path}")
+                    model.load_state_dict(torch.load(path, map_location='cpu'))
+                else:
+                    print(f"No ESPCN x{scale} weights found, using the bicubic-initialised model")
+                self.models[scale] = model.to(self.device).eval()
+            return self.models[scale]
+
+    def run_tiles(self, img, scale):
+        """
+        整数倍放大：每个窗口在四周各取 halo 像素（影像边界外按边缘复制）并补齐到相同尺寸，
+        按 batch 推理后只写回核心区域，结果与切片方式无关
+        """
+        model = self.get_model(scale)
+        h, w = img.shape[:2]
+        halo, tile = self.halo, self.tile_size
+        size = tile + 2 * halo
+        executor = TileExecutor(tile, halo=halo)
+        result = np.empty((h * scale, w * scale, img.shape[2]), dtype=np.uint8)
+        for chunk in batched(executor.windows(h, w), self.batch_size):
+            crops = []
+            for (y0, y1, x0, x1), (ty0, ty1, tx0, tx1) in chunk:
+                pad = ((halo - (y0 - ty0), size - (y1 - y0) - halo - (ty1 - y1)),
+                       (halo - (x0 - tx0), size - (x1 - x0) - halo - (tx1 - x1)), (0, 0))
+                crops.append(np.pad(img[ty0:ty1, tx0:tx1], pad, mode='edge'))
+            batch = torch.from_numpy(np.stack(crops)).to(self.device).permute(0, 3, 1, 2).float() / 255
+            with torch.no_grad():
+                out = model(batch).clamp_(0, 1).mul_(255).round_().byte()
+            out = out.permute(0, 2, 3, 1).cpu().numpy()
+            for ((y0, y1, x0, x1), _), pred in zip(chunk, out):
+                oy, ox = halo * scale, halo * scale
+                result[y0 * scale:y1 * scale, x0 * scale:x1 * scale] = \
+                    pred[oy:oy + (y1 - y0) * scale, ox:ox + (x1 - x0) * scale]
+        return result
+
+    def upscale(self, img, scale, out_size=None):
+        """
+        Args:
+            img: [H, W] 或 [H, W, 3] uint8 数组
+            scale: 放大倍数
+            out_size: 可选的输出尺寸 (h, w)
+
+        Returns:
+            result: 放大后的 uint8 数组
+        """
+        new_h, new_w = out_size or output_size(img, scale)
+        factor = int(np.ceil(scale - 1e-6))
+        if factor <= 1:
+            return cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_CUBIC)
+        gray = img.ndim == 2
+        src = np.stack([img] * 3, -1) if gray else img[:, :, :3]
+        result = self.run_tiles(np.ascontiguousarray(src), factor)
+        if result.shape[:2] != (new_h, new_w):
+            result = cv2.resize(result, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        return result[:, :, 0].copy() if gray else result
@@ -0,0 +1,15 @@
+import cv2
+import numpy as np
+from RStask.SuperResolution.Bicubic import BicubicSuperResolution
+from RStask.SuperResolution.benchmark import synthetic_image, psnr
+
+model = BicubicSuperResolution()
+image = synthetic_image(300)
+for backend in ('bicubic', 'espcn'):
+    for scale in (2, 3, 1.5):
+        result = model.process(image, scale=scale, backend=backend)
+        assert result.shape == (int(300 * scale), int(300 * scale), 3) and result.dtype == np.uint8
+# 未加载权重时 ESPCN 的残差分支为零，输出应与双三次插值基本一致
+plain_bicubic = cv2.resize(image, (600, 600), interpolation=cv2.INTER_CUBIC)
+print('ESPCN vs bicubic PSNR:', psnr(model.process(image, scale=2, backend='espcn'), plain_bicubic))
+model.inference('/data/haonan.guo/RSChatGPT/test.tif', '/data/haonan.guo/RSChatGPT/output.png', scale=2, backend='espcn')
@@ -1,13 +1,33 @@
-from RStask.EdgeDetection.Canny import Image2Canny as ImageEdgeFunction
-from RStask.ImageCaptioning.blip import BLIP as CaptionFunction
-from RStask.LanduseSegmentation.seg_hrnet import HRNet48 as LanduseFunction
-from RStask.ObjectCounting.Yolocounting import YoloCounting as CountingFuncnction
-from RStask.ObjectDetection.YOLOv5 import YoloDetection as DetectionFunction
-from RStask.SceneClassification.ResNetScene import ResNetAID as SceneFunction
-from RStask.InstanceSegmentation.SwinUpper import SwinInstance as InstanceFunction
-from RStask.ChangeDetection.MMchange import MMChangeDetection as ChangeDetectionFunction
-from RStask.CloudRemoval.DarkChannel import DarkChannelCloudRemoval as CloudRemovalFunction
-from RStask.SuperResolution.Bicubic import BicubicSuperResolution as SuperResolutionFunction
-from RStask.Denoising.NonLocalMeans import NonLocalMeansDenoising as DenoisingFunction
-from RStask.HorizontalDetection.HorizontalBBox import HorizontalBBoxDetection as HorizontalDetectionFunction
-from RStask.RotatedDetection.RotatedBBox import RotatedBBoxDetection as RotatedDetectionFunction
\ No newline at end of file
+import importlib
+
+# 工具函数名 -> (模块, 类名)；按需导入，只有实际启用的工具才会加载其依赖
+_FUNCTIONS = {
+    'ImageEdgeFunction': ('RStask.EdgeDetection.Canny', 'Image2Canny'),
+    'CaptionFunction': ('RStask.ImageCaptioning.blip', 'BLIP'),
+    'LanduseFunction': ('RStask.LanduseSegmentation.seg_hrnet', 'HRNet48'),
+    'CountingFuncnction': ('RStask.ObjectCounting.Yolocounting', 'YoloCounting'),
+    'DetectionFunction': ('RStask.ObjectDetection.YOLOv5', 'YoloDetection'),
+    'SceneFunction': ('RStask.SceneClassification.ResNetScene', 'ResNetAID'),
+    'InstanceFunction': ('RStask.InstanceSegmentation.SwinUpper', 'SwinInstance'),
+    'ChangeDetectionFunction': ('RStask.ChangeDetection.MMchange', 'MMChangeDetection'),
+    'CloudRemovalFunction': ('RStask.CloudRemoval.DarkChannel', 'DarkChannelCloudRemoval'),
+    'SuperResolutionFunction': ('RStask.SuperResolution.Bicubic', 'BicubicSuperResolution'),
+    'DenoisingFunction': ('RStask.Denoising.NonLocalMeans', 'NonLocalMeansDenoising'),
+    'HorizontalDetectionFunction': ('RStask.HorizontalDetection.HorizontalBBox', 'HorizontalBBoxDetection'),
+    'RotatedDetectionFunction': ('RStask.RotatedDetection.RotatedBBox', 'RotatedBBoxDetection'),
+    'PipelineFunction': ('RStask.Pipeline.ImageChain', 'ImageChain'),
+}
+__all__ = list(_FUNCTIONS)
+
+
+def __getattr__(name):
+    if name not in _FUNCTIONS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module, attr = _FUNCTIONS[name]
+    value = getattr(importlib.import_module(module), attr)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
\ No newline at end of file
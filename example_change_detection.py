@@ -117,39 +117,21 @@ def example_batch_processing():
         print(f"警告: 数据目录不存在")
         return
     
-    # 创建输出目录
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # 获取图像列表
-    a_files = sorted([f for f in os.listdir(a_dir) if f.endswith('.png')])
-    b_files = sorted([f for f in os.listdir(b_dir) if f.endswith('.png')])
-    
-    # 只处理前 3 对图像作为示例
-    max_samples = min(3, len(a_files), len(b_files))
-    
-    print(f"\n将处理 {max_samples} 对图像\n")
-    
-    for i in range(max_samples):
-        pre_image = os.path.join(a_dir, a_files[i])
-        post_image = os.path.join(b_dir, b_files[i])
-        output_path = os.path.join(output_dir, f"result_{i+1:03d}.png")
-        
-        print(f"处理第 {i+1}/{max_samples} 对图像...")
-        print(f"  前时相: {a_files[i]}")
-        print(f"  后时相: {b_files[i]}")
-        
-        try:
-            result = cd_func.inference(
-                pre_image,
-                post_image,
-                output_path,
-                change_caption="detect urban development and land use changes"
-            )
-            print(f"  ✓ {result}")
-        except Exception as e:
-            print(f"  ✗ 处理失败: {e}")
-        
-        print()
+    # 按文件名配对 A / B 目录，多进程预取 + 批量推理 + 异步写盘；
+    # 中断后再次运行会根据 output_dir/progress.jsonl 跳过已完成的图像对
+    summary = cd_func.inference_batch(
+        (a_dir, b_dir),
+        output_dir,
+        change_caption="detect urban development and land use changes",
+        batch_size=16,
+        num_workers=4,
+        save_panel=True
+    )
+    
+    print(f"\n处理 {summary['processed']} 对，跳过 {summary['skipped']} 对，"
+          f"吞吐 {summary['pairs_per_sec']:.2f} pairs/sec")
+    for (pre_image, post_image), error in summary['failed']:
+        print(f"  ✗ 处理失败: {pre_image} {error}")
     
     print(f"批量处理完成！结果保存在: {output_dir}")
     print("=" * 80)